@@ -0,0 +1,89 @@
+"""
+Benchmark: user_behaviors hot queries before/after migration 1
+- Builds a throwaway SQLite DB per table size with the pre-migration schema
+- Times get_user_behaviors_with_context (the recommend cold path) and
+  per-product activity lookups, then applies migrations and times again
+
+Run from the repo root:  python benchmarks/behavior_indexes.py [sizes...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+from models import Base, Product, UserBehavior
+from migrations import run_migrations
+from crud import get_user_behaviors_with_context
+
+N_USERS = 5000
+N_PRODUCTS = 2000
+REPEATS = 50
+
+def build_database(path, n_behaviors):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        # Pre-migration schema: drop the indexes create_all added
+        for name in ("ix_user_behaviors_userid_timestamp", "ix_user_behaviors_productid_action",
+                     "ix_products_active_in_stock"):
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        connection.execute(insert(Product), [
+            {"name": f"Product {i}", "price": 10.0, "description": "",
+             "productcontext": f"context {i}", "stock": i % 5, "isactive": i % 7 != 0}
+            for i in range(1, N_PRODUCTS + 1)
+        ])
+        rng = random.Random(0)
+        start = datetime(2024, 1, 1)
+        batch = []
+        for i in range(n_behaviors):
+            batch.append({
+                "userid": f"user_{rng.randrange(N_USERS)}",
+                "productid": rng.randrange(1, N_PRODUCTS + 1),
+                "action": rng.choice(("view", "view", "view", "click")),
+                "searchquery": None,
+                "timestamp": start + timedelta(seconds=i)
+            })
+            if len(batch) == 50000:
+                connection.execute(insert(UserBehavior), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(UserBehavior), batch)
+    return engine
+
+def time_queries(engine):
+    rng = random.Random(1)
+    with Session(engine) as db:
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            get_user_behaviors_with_context(db, f"user_{rng.randrange(N_USERS)}")
+        per_user = (time.perf_counter() - started) / REPEATS * 1000
+
+        started = time.perf_counter()
+        for _ in range(REPEATS):
+            db.query(UserBehavior.id).filter(
+                UserBehavior.productid == rng.randrange(1, N_PRODUCTS + 1),
+                UserBehavior.action == "click"
+            ).all()
+        per_product = (time.perf_counter() - started) / REPEATS * 1000
+    return per_user, per_product
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'rows':>10} | {'user history ms':>22} | {'product activity ms':>22}")
+    print(f"{'':>10} | {'before':>10} {'after':>11} | {'before':>10} {'after':>11}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_database(os.path.join(tmp, "bench.db"), size)
+            user_before, product_before = time_queries(engine)
+            run_migrations(engine)
+            user_after, product_after = time_queries(engine)
+            engine.dispose()
+        print(f"{size:>10} | {user_before:>10.2f} {user_after:>11.3f} | "
+              f"{product_before:>10.2f} {product_after:>11.3f}")
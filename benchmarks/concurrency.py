@@ -0,0 +1,70 @@
+"""
+Benchmark: endpoint throughput under many concurrent connections
+- Fires N requests at a running server from C concurrent connections
+  (httpx.AsyncClient) and reports req/s and latency percentiles
+- Compare runs before/after a change at the same concurrency levels (run
+  the client on a different machine/cores than the server for real numbers)
+
+Needs httpx (pip install httpx). Start the app first (one worker makes
+event-loop stalls visible):
+    uvicorn main:app --workers 1
+then from the repo root:
+    python benchmarks/concurrency.py [--url URL] [--requests N] [--concurrency C ...] [--path P ...]
+
+Reference run (1 CPU shared by client and server, so req/s is CPU-bound):
+the sync-Session routes deadlock at 10 connections with the default read
+pool (the event loop blocks on a pool checkout while the sessions holding
+connections wait on the loop to close); the async path serves 200
+connections with no pool timeouts at about the same req/s.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+DEFAULT_PATHS = ["/", "/search?q=wireless", "/api/recommendations/?user_id=demo_user_1"]
+
+async def run_level(client, path, n_requests, concurrency):
+    latencies, errors = [], 0
+    remaining = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    return n_requests / elapsed, percentile(0.5), percentile(0.99), errors
+
+async def main(args):
+    limits = httpx.Limits(max_connections=max(args.concurrency),
+                          max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        for path in args.path or DEFAULT_PATHS:
+            await client.get(path)  # Warm up (catalog fit, profile build)
+            print(f"\n{path}")
+            print(f"{'conns':>6} | {'req/s':>9} | {'p50 ms':>9} | {'p99 ms':>9} | {'errors':>6}")
+            for concurrency in args.concurrency:
+                rps, p50, p99, errors = await run_level(client, path, args.requests, concurrency)
+                print(f"{concurrency:>6} | {rps:>9.1f} | {p50:>9.2f} | {p99:>9.2f} | {errors:>6}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 200])
+    parser.add_argument("--path", action="append")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+"""
+Check: GET /api/recommendations/ stays within its SQL statement budget
+- Runs the route in-process (TestClient) on a throwaway SQLite DB with
+  ENFORCE_QUERY_BUDGETS=1, cold (profile built from the DB), warm (cached
+  profile), right after a catalog change that adds new words (the sync it
+  starts runs in the background), once that sync has published, and cold
+  with a behavior still buffered (flushed by the request), and reports the
+  statements each issued
+- Then shrinks the budget below what the route needs and asserts the
+  request fails with QueryBudgetExceeded
+
+Run from the repo root:  python benchmarks/query_budget.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+# The app opens ./ecommerce.db and ./snapshots: work in a scratch directory
+os.environ["ENFORCE_QUERY_BUDGETS"] = "1"
+os.chdir(tempfile.mkdtemp(prefix="query-budget-"))
+
+from fastapi.testclient import TestClient
+from database import SessionLocal, QueryBudgetExceeded, query_budget
+from models import Product, UserBehavior
+
+WORDS = ("red blue green shirt pants shoe running leather cotton wool jacket hat "
+         "summer winter sport casual formal kids women men").split()
+
+def seed(n_products=200, n_users=20, events_per_user=15):
+    rng = random.Random(0)
+    with SessionLocal() as db:
+        for i in range(n_products):
+            context = " ".join(rng.sample(WORDS, 5))
+            db.add(Product(name=f"Product {i}", price=10 + i, description=context,
+                           productcontext=context, stock=5, isactive=True))
+        db.flush()
+        for user in range(1, n_users + 1):
+            for _ in range(events_per_user):
+                db.add(UserBehavior(userid=user, productid=rng.randint(1, n_products),
+                                    action=rng.choice(("view", "view", "click"))))
+            db.add(UserBehavior(userid=user, action="search", searchquery=rng.choice(WORDS)))
+        db.commit()
+
+def counting(limit, counters):
+    """query_budget(limit) that also hands each request's QueryCounter to `counters`"""
+    budget = query_budget(limit, "GET /api/recommendations/")
+    async def dependency():
+        async for counter in budget():
+            counters.append(counter)
+            yield counter
+    return dependency
+
+if __name__ == "__main__":
+    seed()
+    from main import app
+    from ingest import behavior_buffer
+    from schemas import UserBehaviorCreate
+    from routers.recommend import (RECOMMEND_QUERY_BUDGET, recommend_query_budget,
+                                   schedule_engine_sync)
+
+    counters = []
+    app.dependency_overrides[recommend_query_budget] = counting(RECOMMEND_QUERY_BUDGET, counters)
+    with TestClient(app) as client:
+        for label in ("cold", "warm"):
+            response = client.get("/api/recommendations/", params={"user_id": "1"})
+            assert response.status_code == 200, response.text
+            print(f"{label}: {counters[-1].count} statements (budget {RECOMMEND_QUERY_BUDGET})")
+        warm = counters[-1].count
+
+        # Catalog change: a product with words the vectorizer has never seen
+        with SessionLocal() as db:
+            db.add(Product(name="Zebra", price=99, description="zebra quokka ocelot",
+                           productcontext="zebra quokka ocelot", stock=5, isactive=True))
+            db.commit()
+        response = client.get("/api/recommendations/", params={"user_id": "1"})
+        assert response.status_code == 200, response.text
+        print(f"after catalog change: {counters[-1].count} statements (budget {RECOMMEND_QUERY_BUDGET})")
+        schedule_engine_sync().result()  # Let the background sync publish
+        response = client.get("/api/recommendations/", params={"user_id": "1"})
+        assert response.status_code == 200, response.text
+        print(f"after the sync: {counters[-1].count} statements (budget {RECOMMEND_QUERY_BUDGET})")
+
+        # Cold profile of a user whose just-tracked view is still in the
+        # write-behind buffer (flusher stopped): the request flushes it first
+        behavior_buffer.stop()
+        behavior_buffer.enqueue(UserBehaviorCreate(userid="2", productid=1, action="view"))
+        response = client.get("/api/recommendations/", params={"user_id": "2"})
+        assert response.status_code == 200, response.text
+        print(f"cold, buffered behavior: {counters[-1].count} statements (budget {RECOMMEND_QUERY_BUDGET})")
+
+        # Enforcement: a budget below the warm path must fail the request
+        app.dependency_overrides[recommend_query_budget] = counting(warm - 1, counters)
+        try:
+            client.get("/api/recommendations/", params={"user_id": "1"})
+        except QueryBudgetExceeded as e:
+            print(f"over budget: raised QueryBudgetExceeded ({e})")
+        else:
+            raise AssertionError("over-budget request did not raise QueryBudgetExceeded")
@@ -0,0 +1,76 @@
+"""
+Benchmark: /search substring filter vs the FTS5 index (migration 2)
+- Builds a throwaway SQLite DB per catalog size with the current schema
+- "substring": the old route - load every active product, then a Python
+  `q in name or q in description` check
+- "fts5": crud.search_products (ranked prefix MATCH, first page)
+
+Run from the repo root:  python benchmarks/search_fts.py [sizes...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+from models import Base, Product
+from migrations import run_migrations
+from crud import search_products
+
+WORDS = ("wireless bass headphones gym fitness sports running shoes trail "
+         "laptop gaming rgb keyboard mouse office chair desk lamp kitchen "
+         "blender coffee grinder travel backpack camera lens tripod").split()
+QUERIES = ["wireless", "head", "gaming mouse", "coffee grind", "trail run"]
+REPEATS = 20
+
+def build_database(path, n_products):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    run_migrations(engine)  # FTS table + triggers index the rows as they are inserted
+    rng = random.Random(0)
+    with engine.begin() as connection:
+        batch = []
+        for i in range(1, n_products + 1):
+            batch.append({
+                "name": " ".join(rng.sample(WORDS, 3)).title(),
+                "price": 10.0,
+                "description": " ".join(rng.choices(WORDS, k=20)),
+                "productcontext": "",
+                "stock": 1 + i % 5,
+                "isactive": i % 10 != 0
+            })
+            if len(batch) == 50000:
+                connection.execute(insert(Product), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(Product), batch)
+    return engine
+
+def substring_search(db, q):
+    products = db.query(Product).filter(Product.isactive == True, Product.stock > 0).all()
+    q = q.lower()
+    return [p for p in products if q in p.name.lower() or q in (p.description or '').lower()]
+
+def time_search(engine, search):
+    with Session(engine) as db:
+        started = time.perf_counter()
+        for i in range(REPEATS):
+            search(db, QUERIES[i % len(QUERIES)])
+            db.expunge_all()
+        return (time.perf_counter() - started) / REPEATS * 1000
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'products':>10} | {'substring ms':>13} | {'fts5 ms':>9} | {'speedup':>8}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_database(os.path.join(tmp, "bench.db"), size)
+            substring = time_search(engine, substring_search)
+            fts = time_search(engine, lambda db, q: search_products(db, q))
+            engine.dispose()
+        print(f"{size:>10} | {substring:>13.2f} | {fts:>9.3f} | {substring / fts:>7.0f}x")
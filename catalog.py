@@ -0,0 +1,71 @@
+"""
+Catalog change tracking
+- The catalog version lives in the database: triggers on products append a
+  (version, product_id) row to catalog_changes in the same transaction as
+  every insert/update/delete (see migrations.py), so all workers share one
+  monotonic version
+- Each worker reads that version before serving from its in-memory indexes
+  and re-indexes only the products logged since its own version
+- The log is bounded; consumers further behind must do a full rebuild
+"""
+
+from sqlalchemy import text
+from database import AsyncReadSessionLocal
+import time
+
+_VERSION = text("SELECT COALESCE(MAX(version), 0) FROM catalog_changes")
+_CHANGES = text("SELECT version, product_id FROM catalog_changes "
+                "WHERE version > :since AND version <= :until ORDER BY version")
+
+class CatalogTracker:
+    def __init__(self, poll_interval=0.5):
+        """
+        Args:
+            poll_interval: Max age in seconds of the version poll_async()
+                serves without reading the database again
+        """
+        self.version = 0  # Last version read from the database
+        self.poll_interval = poll_interval
+        self._polled_at = float('-inf')
+
+    def _seen(self, version):
+        self.version = int(version)
+        self._polled_at = time.monotonic()
+        return self.version
+
+    def refresh(self, db):
+        """Read the current catalog version (sync Session); returns it"""
+        return self._seen(db.execute(_VERSION).scalar())
+
+    async def refresh_async(self, db):
+        """Read the current catalog version (AsyncSession); returns it"""
+        return self._seen((await db.execute(_VERSION)).scalar())
+
+    async def poll_async(self):
+        """Current version, re-read at most every poll_interval (for routes without a session)"""
+        if time.monotonic() - self._polled_at < self.poll_interval:
+            return self.version
+        async with AsyncReadSessionLocal() as db:
+            return await self.refresh_async(db)
+
+    def changes_since(self, db, version, until=None):
+        """
+        Product ids touched after `version`, up to `until` (default: the
+        version last read)
+
+        Returns:
+            Set of product ids, or None if the log no longer reaches back to
+            `version` (caller should rebuild from the full catalog)
+        """
+        until = self.version if until is None else until
+        if not isinstance(version, int) or version > until:
+            return None
+        if version == until:
+            return set()
+        rows = db.execute(_CHANGES, {"since": version, "until": until}).all()
+        if not rows or rows[0][0] != version + 1:
+            return None  # Pruned past `version`
+        return {product_id for _, product_id in rows}
+
+# Process-wide reader of the shared version (one per worker)
+catalog_tracker = CatalogTracker()
@@ -1,6 +1,39 @@
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from models import Product, UserBehavior
 from schemas import ProductCreate, UserBehaviorCreate
+import re
+
+IN_CLAUSE_CHUNK = 500  # Stay well below SQLite's bound-parameter limit
+PAGE_SIZE = 60          # Products per listing page
+CATALOG_STREAM_BATCH = 10000
+SEARCH_PAGE_SIZE = 30
+SEARCH_NAME_WEIGHT = 10.0  # bm25 column weights: name matches outrank description matches
+
+def _chunks(values, size=IN_CLAUSE_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+_SQL_NUMBER = re.compile(r'\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*')
+
+def user_id_key(user_id):
+    """
+    str() of what SQLite stores for `user_id` in user_behaviors.userid: the
+    INTEGER column affinity turns numeric text into a number ('007' -> '7'),
+    any other text is kept as is - the key rows read back are grouped by
+    """
+    text = str(user_id)
+    if not _SQL_NUMBER.fullmatch(text):
+        return text
+    number = float(text)
+    if not number.is_integer():
+        return str(number)
+    try:
+        return str(int(text))  # Exact for integer literals
+    except ValueError:
+        return str(int(number))
 
 def create_product(db: Session, product: ProductCreate):
     db_product = Product(**product.dict())
@@ -9,15 +42,149 @@ def create_product(db: Session, product: ProductCreate):
     db.refresh(db_product)
     return db_product
 
+def toggle_product(db: Session, product_id: int):
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if product:
+        product.isactive = not product.isactive
+        db.commit()
+    return product
+
 def get_products(db: Session, skip: int = 0, limit: int = 100):
     return db.query(Product).filter(
         Product.isactive == True, 
         Product.stock > 0
     ).offset(skip).limit(limit).all()
 
+def iter_active_catalog(db: Session, batch_size: int = CATALOG_STREAM_BATCH):
+    """
+    Stream (id, productcontext) for the ENTIRE active catalog
+    Column-only select fetched in yield_per batches - no ORM objects and
+    never the whole catalog in memory at once.
+    """
+    result = db.execute(
+        select(Product.id, Product.productcontext).where(
+            Product.isactive == True,
+            Product.stock > 0
+        ).order_by(Product.id).execution_options(yield_per=batch_size)
+    )
+    for product_id, productcontext in result:
+        yield product_id, productcontext
+
+def iter_active_product_names(db: Session, batch_size: int = CATALOG_STREAM_BATCH):
+    """Stream (id, name) for the active catalog (suggestion index builds)"""
+    result = db.execute(
+        select(Product.id, Product.name).where(
+            Product.isactive == True,
+            Product.stock > 0
+        ).execution_options(yield_per=batch_size)
+    )
+    for product_id, name in result:
+        yield product_id, name
+
+def iter_item_interactions(db: Session, batch_size: int = CATALOG_STREAM_BATCH):
+    """Stream (userid, productid, action) for every view/click, oldest first"""
+    result = db.execute(
+        select(UserBehavior.userid, UserBehavior.productid, UserBehavior.action).where(
+            UserBehavior.productid.isnot(None),
+            UserBehavior.action.in_(("view", "click"))
+        ).order_by(UserBehavior.timestamp).execution_options(yield_per=batch_size)
+    )
+    for userid, productid, action in result:
+        yield userid, productid, action
+
+def iter_training_behaviors(db: Session, batch_size: int = CATALOG_STREAM_BATCH):
+    """Stream (userid, productid, action, timestamp) of views/clicks/searches, per user, oldest first"""
+    result = db.execute(
+        select(UserBehavior.userid, UserBehavior.productid, UserBehavior.action, UserBehavior.timestamp).where(
+            UserBehavior.action.in_(("view", "click", "search"))
+        ).order_by(UserBehavior.userid, UserBehavior.timestamp).execution_options(yield_per=batch_size)
+    )
+    for userid, productid, action, timestamp in result:
+        yield userid, productid, action, timestamp
+
+def get_max_behavior_id(db: Session):
+    """Highest stored behavior id (0 if none) - marks how far a model has seen"""
+    return db.execute(select(func.max(UserBehavior.id))).scalar() or 0
+
+def get_product_interaction_counts(db: Session):
+    """product_id -> number of views/clicks (one grouped scan of the productid index)"""
+    return dict(db.execute(
+        select(UserBehavior.productid, func.count()).where(
+            UserBehavior.productid.isnot(None),
+            UserBehavior.action.in_(("view", "click"))
+        ).group_by(UserBehavior.productid)
+    ).all())
+
+def get_popular_search_queries(db: Session, limit: int = 10000):
+    """(query, count) for the most frequent searches, case-insensitively grouped"""
+    query = func.lower(func.trim(UserBehavior.searchquery))
+    return db.execute(
+        select(query, func.count()).where(
+            UserBehavior.action == "search",
+            UserBehavior.searchquery.isnot(None)
+        ).group_by(query).order_by(func.count().desc()).limit(limit)
+    ).all()
+
+def has_active_products(db: Session):
+    return db.query(Product.id).filter(
+        Product.isactive == True,
+        Product.stock > 0
+    ).first() is not None
+
+def get_products_by_ids(db: Session, product_ids):
+    products = []
+    for chunk in _chunks(product_ids):
+        products.extend(db.query(Product).filter(Product.id.in_(chunk)).all())
+    return products
+
 def get_product(db: Session, product_id: int):
     return db.query(Product).filter(Product.id == product_id, Product.isactive == True).first()
 
+def build_fts_query(query: str):
+    """
+    User text → FTS5 MATCH expression: every word must match, as a prefix
+    ("wire head" → "wire"* AND "head"*). Words are quoted, so FTS5 operators
+    typed by users are searched as plain text. None if there are no words.
+    """
+    terms = re.findall(r"\w+", query.lower())
+    if not terms:
+        return None
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+def _search_statement():
+    return select(Product).from_statement(text(
+        "SELECT products.* FROM products_fts "
+        "JOIN products ON products.id = products_fts.rowid "
+        "WHERE products_fts MATCH :match AND products.isactive = 1 AND products.stock > 0 "
+        f"ORDER BY bm25(products_fts, {SEARCH_NAME_WEIGHT}, 1.0) "
+        "LIMIT :limit OFFSET :offset"
+    ))
+
+def _search_params(query, page, limit):
+    match = build_fts_query(query)
+    if match is None:
+        return None
+    # One extra row tells whether another page exists
+    return {"match": match, "limit": limit + 1, "offset": max(page - 1, 0) * limit}
+
+def _search_page(products, page, limit):
+    if len(products) > limit:
+        return products[:limit], page + 1
+    return products, None
+
+def search_products(db: Session, query: str, page: int = 1, limit: int = SEARCH_PAGE_SIZE):
+    """
+    Ranked full-text search over active products (FTS5, bm25)
+    
+    Returns:
+        (products, next_page) - next_page is None on the last page
+    """
+    params = _search_params(query, page, limit)
+    if params is None:
+        return [], None
+    products = db.execute(_search_statement(), params).scalars().all()
+    return _search_page(products, page, limit)
+
 def create_user_behavior(db: Session, behavior: UserBehaviorCreate):
     db_behavior = UserBehavior(**behavior.dict())
     db.add(db_behavior)
@@ -25,6 +192,103 @@ def create_user_behavior(db: Session, behavior: UserBehaviorCreate):
     db.refresh(db_behavior)
     return db_behavior
 
+def create_user_behaviors_bulk(db: Session, rows):
+    """Insert many behavior dicts in one transaction (executemany)"""
+    if not rows:
+        return 0
+    db.execute(insert(UserBehavior), rows)
+    db.commit()
+    return len(rows)
+
 def get_user_behaviors(db: Session, user_id: int):  # ← user_id is STRING, not int!
-    return db.query(UserBehavior).filter(UserBehavior.userid == user_id).all()
+    return db.query(UserBehavior).filter(UserBehavior.userid == user_id).order_by(
+        UserBehavior.timestamp
+    ).all()
+
+def get_user_behaviors_with_context(db: Session, user_id):
+    """(behavior, productcontext) pairs in ONE joined query - no per-behavior product lookups"""
+    return db.query(UserBehavior, Product.productcontext).outerjoin(
+        Product, Product.id == UserBehavior.productid
+    ).filter(UserBehavior.userid == user_id).order_by(UserBehavior.timestamp).all()
+
+def get_behaviors_with_context_for_users(db: Session, user_ids):
+    pairs = []
+    for chunk in _chunks(user_ids):
+        pairs.extend(db.query(UserBehavior, Product.productcontext).outerjoin(
+            Product, Product.id == UserBehavior.productid
+        ).filter(UserBehavior.userid.in_(chunk)).all())
+    return pairs
+
+# ⚡ ASYNC READS (AsyncSession over aiosqlite) - same queries as above for
+# the hot endpoints, awaited instead of blocking the event loop
+
+def _active_products():
+    return select(Product).where(Product.isactive == True, Product.stock > 0)
+
+async def search_products_async(db: AsyncSession, query: str, page: int = 1,
+                                limit: int = SEARCH_PAGE_SIZE):
+    """Async search_products() - (products, next_page)"""
+    params = _search_params(query, page, limit)
+    if params is None:
+        return [], None
+    result = await db.execute(_search_statement(), params)
+    return _search_page(result.scalars().all(), page, limit)
+
+async def get_products_page_async(db: AsyncSession, after_id: int = 0, limit: int = PAGE_SIZE):
+    """
+    Keyset page of the active catalog (id > after_id) - cost does not grow
+    with page depth the way OFFSET does
+    
+    Returns:
+        (products, next_after_id) - next_after_id is None on the last page
+    """
+    result = await db.execute(
+        _active_products().where(Product.id > after_id).order_by(Product.id).limit(limit + 1)
+    )
+    products = result.scalars().all()
+    if len(products) > limit:
+        products = products[:limit]
+        return products, products[-1].id
+    return products, None
+
+async def get_active_product_ids_async(db: AsyncSession, min_price: float = None,
+                                       max_price: float = None):
+    """Active product ids, optionally within a price range (column-only query)"""
+    statement = select(Product.id).where(Product.isactive == True, Product.stock > 0)
+    if min_price is not None:
+        statement = statement.where(Product.price >= min_price)
+    if max_price is not None:
+        statement = statement.where(Product.price <= max_price)
+    result = await db.execute(statement)
+    return result.scalars().all()
+
+async def get_newest_products_async(db: AsyncSession, limit: int = 5):
+    result = await db.execute(_active_products().order_by(Product.id.desc()).limit(limit))
+    return result.scalars().all()
+
+async def get_product_async(db: AsyncSession, product_id: int):
+    result = await db.execute(
+        select(Product).where(Product.id == product_id, Product.isactive == True).limit(1)
+    )
+    return result.scalars().first()
+
+async def get_products_by_ids_async(db: AsyncSession, product_ids):
+    products = []
+    for chunk in _chunks(product_ids):
+        result = await db.execute(select(Product).where(Product.id.in_(chunk)))
+        products.extend(result.scalars().all())
+    return products
+
+async def count_user_behaviors_async(db: AsyncSession, user_id):
+    """Number of stored behaviors of a user - one index-only lookup"""
+    result = await db.execute(select(func.count(UserBehavior.id)).where(UserBehavior.userid == user_id))
+    return result.scalar()
 
+async def get_user_behaviors_with_context_async(db: AsyncSession, user_id):
+    """Async get_user_behaviors_with_context() - one joined query"""
+    result = await db.execute(
+        select(UserBehavior, Product.productcontext).outerjoin(
+            Product, Product.id == UserBehavior.productid
+        ).where(UserBehavior.userid == user_id).order_by(UserBehavior.timestamp)
+    )
+    return result.all()
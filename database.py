@@ -1,22 +1,203 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from models import Base
+from migrations import run_migrations
+from contextlib import contextmanager
+import contextvars
+import os
+import threading
+import time
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./ecommerce.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./ecommerce.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
+# SQLite performance profile (override per deployment via env)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",        # Readers never block on the writer (and vice versa)
+    "synchronous": "NORMAL",      # Durable at checkpoints; safe with WAL
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),  # Negative = KiB
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "temp_store": "MEMORY"
+}
+READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", 8))
+
+def create_sqlite_engine(url=SQLALCHEMY_DATABASE_URL, read_only=False, pool_size=1,
+                         pragmas=None):
+    """
+    SQLite engine with the performance pragmas applied to every new connection
+    
+    Args:
+        url: SQLAlchemy SQLite URL
+        read_only: Connections refuse writes (PRAGMA query_only)
+        pool_size: Pooled connections (1 for the single writer)
+        pragmas: Dict of PRAGMA name -> value (defaults to SQLITE_PRAGMAS)
+    """
+    sqlite_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=pool_size,
+        max_overflow=0
+    )
+    _install_pragmas(sqlite_engine, read_only, pragmas)
+    return sqlite_engine
+
+def create_async_sqlite_engine(url=ASYNC_DATABASE_URL, read_only=True, pool_size=READ_POOL_SIZE,
+                               pragmas=None):
+    """aiosqlite twin of create_sqlite_engine() for AsyncSession (read path by default)"""
+    async_engine = create_async_engine(url, pool_size=pool_size, max_overflow=0)
+    _install_pragmas(async_engine.sync_engine, read_only, pragmas)
+    return async_engine
+
+def _install_pragmas(sqlite_engine, read_only, pragmas):
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    
+    @event.listens_for(sqlite_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+# One writer connection + a pool of read-only connections
+engine = create_sqlite_engine()
+read_engine = create_sqlite_engine(read_only=True, pool_size=READ_POOL_SIZE)
+# Event-loop-friendly readers for the hot async endpoints
+async_read_engine = create_async_sqlite_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession,
+                                           autoflush=False, expire_on_commit=False)
+
+class SingleWriter:
+    """
+    Funnels every write transaction through the one writer connection
+    - Writers queue on a lock in-process instead of spinning on SQLITE_BUSY
+    - Records how long writers waited / held the lock (contention metrics)
+    """
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "acquisitions": 0,
+            "contended": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "hold_ms_total": 0.0,
+            "hold_ms_max": 0.0
+        }
+    
+    @contextmanager
+    def session(self):
+        """Exclusive write Session (committed by the caller, closed on exit)"""
+        started = time.perf_counter()
+        contended = not self._lock.acquire(blocking=False)
+        if contended:
+            self._lock.acquire()
+        acquired = time.perf_counter()
+        db = self.session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+            released = time.perf_counter()
+            self._lock.release()
+            self._record(contended, (acquired - started) * 1000, (released - acquired) * 1000)
+    
+    def _record(self, contended, wait_ms, hold_ms):
+        with self._stats_lock:
+            self.stats["acquisitions"] += 1
+            self.stats["contended"] += int(contended)
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+            self.stats["hold_ms_total"] += hold_ms
+            self.stats["hold_ms_max"] = max(self.stats["hold_ms_max"], hold_ms)
+    
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        for key in ("wait_ms_total", "wait_ms_max", "hold_ms_total", "hold_ms_max"):
+            stats[key] = round(stats[key], 2)
+        return stats
+
+db_writer = SingleWriter(SessionLocal)
+
+# Query budgets: set ENFORCE_QUERY_BUDGETS=1 (tests/CI) to raise instead of warn
+ENFORCE_QUERY_BUDGETS = os.environ.get("ENFORCE_QUERY_BUDGETS", "") not in ("", "0")
+
+_active_query_counter = contextvars.ContextVar("active_query_counter", default=None)
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryCounter:
+    """Counts SQL statements executed while active (per request / per block)"""
+    def __init__(self, limit=None, label="block", enforce=True):
+        self.limit = limit
+        self.label = label
+        self.enforce = enforce
+        self.count = 0
+    
+    def __enter__(self):
+        self._previous = _active_query_counter.get()
+        _active_query_counter.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        _active_query_counter.set(self._previous)
+        if exc_type is None:
+            self.check()
+        return False
+    
+    def check(self):
+        if self.limit is None or self.count <= self.limit:
+            return
+        message = f"{self.label} issued {self.count} SQL statements (budget {self.limit})"
+        if self.enforce:
+            raise QueryBudgetExceeded(message)
+        print(f"⚠️  {message}")
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _active_query_counter.get()
+    if counter is not None:
+        counter.count += 1
+
+for _engine in (engine, read_engine, async_read_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _count_query)
+
+def query_budget(limit, label="request"):
+    """
+    Dependency factory: count the SQL statements of one request and flag it
+    when it issues more than `limit` (raises when ENFORCE_QUERY_BUDGETS is set)
+    """
+    async def counter_dependency():
+        with QueryCounter(limit, label, enforce=ENFORCE_QUERY_BUDGETS) as counter:
+            yield counter
+    return counter_dependency
 
 def get_db():
-    db = SessionLocal()
+    """Write Session - holds the single writer for the whole request"""
+    with db_writer.session() as db:
+        yield db
+
+def get_read_db():
+    """Read-only Session from the reader pool (listing / recommend paths)"""
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-# Create tables
+async def get_async_db():
+    """Read-only AsyncSession - queries await aiosqlite instead of blocking the event loop"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+# Create tables, then bring existing databases up to the current schema
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
@@ -0,0 +1,158 @@
+"""
+Write-Behind UserBehavior Ingestion
+- Request handlers enqueue behavior rows without touching the database
+- A background thread bulk-inserts batches (executemany, one transaction)
+  every flush_interval, or as soon as flush_size rows are waiting
+- Bounded queue: overflow either drops or applies short backpressure
+- Flushes whatever is left on shutdown
+"""
+
+from datetime import datetime
+import os
+import queue
+import threading
+import time
+from database import db_writer
+from crud import create_user_behaviors_bulk
+
+class BehaviorBuffer:
+    def __init__(self, session_factory=db_writer.session, flush_size=500, flush_interval=1.0,
+                 max_queue=10000, overflow="drop", block_timeout=0.05):
+        """
+        Args:
+            session_factory: Context manager yielding the Session used by the
+                flusher (the serialized single writer by default)
+            flush_size: Max rows per bulk insert
+            flush_interval: Max seconds a row waits before being flushed
+            max_queue: Queue bound (rows)
+            overflow: 'drop' = discard when full, 'block' = wait up to
+                block_timeout for space (backpressure), then discard
+            block_timeout: Backpressure wait in seconds
+        """
+        if overflow not in ("drop", "block"):
+            raise ValueError("overflow must be 'drop' or 'block'")
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "backpressure_waits": 0,
+            "flushed": 0,
+            "flushes": 0,
+            "flush_failures": 0,
+            "last_flush_ms": 0.0
+        }
+
+    def _bump(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def enqueue(self, behavior):
+        """
+        Queue a UserBehaviorCreate for insertion (never touches the DB)
+
+        Returns:
+            False if the row was dropped because the queue is full
+        """
+        row = behavior.dict()
+        row["timestamp"] = datetime.utcnow()  # Event time, not flush time
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.overflow != "block":
+                self._bump("dropped")
+                return False
+            self._bump("backpressure_waits")
+            try:
+                self._queue.put(row, timeout=self.block_timeout)
+            except queue.Full:
+                self._bump("dropped")
+                return False
+        self._bump("enqueued")
+        if self._queue.qsize() >= self.flush_size:
+            self._wake.set()
+        return True
+
+    def _drain(self):
+        """Take up to flush_size rows that are queued right now"""
+        rows = []
+        while len(rows) < self.flush_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        try:
+            with self.session_factory() as db:
+                create_user_behaviors_bulk(db, rows)  # Closing rolls back on failure
+        except Exception as e:
+            self._bump("flush_failures")
+            print(f"❌ Behavior flush failed ({len(rows)} rows lost): {e}")
+            return
+        with self._stats_lock:
+            self.stats["flushed"] += len(rows)
+            self.stats["flushes"] += 1
+            self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    def flush(self):
+        """
+        Synchronously write everything queued right now
+
+        Rows stay in the queue until a flush holds the lock, so once this
+        returns every row enqueued before the call is committed.
+        """
+        with self._flush_lock:
+            while True:
+                rows = self._drain()
+                if not rows:
+                    return
+                self._write(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="behavior-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the flusher and write the remaining rows (call on shutdown)"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.flush()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        with self._stats_lock:
+            return dict(self.stats, queue_depth=self._queue.qsize(),
+                        queue_capacity=self._queue.maxsize)
+
+# Process-wide buffer used by the user-facing routes
+behavior_buffer = BehaviorBuffer(
+    flush_size=int(os.environ.get("BEHAVIOR_FLUSH_SIZE", 500)),
+    flush_interval=float(os.environ.get("BEHAVIOR_FLUSH_INTERVAL", 1.0)),
+    max_queue=int(os.environ.get("BEHAVIOR_QUEUE_SIZE", 10000)),
+    overflow=os.environ.get("BEHAVIOR_OVERFLOW", "drop")
+)
@@ -4,7 +4,9 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, db_writer
+from ingest import behavior_buffer
+from scoring import scoring_executor
 
 app = FastAPI(title="E-Commerce AI Recommendations 🎯")
 
@@ -17,19 +19,41 @@ else:
 
 templates = Jinja2Templates(directory="templates")
 
+# Write-behind behavior ingestion: start the flusher, drain it on shutdown
+app.add_event_handler("startup", behavior_buffer.start)
+app.add_event_handler("shutdown", behavior_buffer.stop)
+app.add_event_handler("shutdown", scoring_executor.shutdown)
+
 # 🔥 CRITICAL: Include ALL routers
 try:
-    from routers import admin, user, recommend
+    from routers import admin, user, recommend, search, suggest, similar, factorized
     app.include_router(admin.router, prefix="/admin", tags=["admin"])
     app.include_router(user.router, tags=["user"])
     app.include_router(recommend.router, prefix="/api", tags=["recommendations"])
+    app.include_router(search.router, prefix="/api", tags=["search"])
+    app.include_router(suggest.router, prefix="/api", tags=["search"])
+    app.include_router(similar.router, prefix="/api", tags=["recommendations"])
+    app.include_router(factorized.router, prefix="/api", tags=["recommendations"])
+    # Map the shared recommender snapshot at boot so no worker fits on its first request
+    app.add_event_handler("startup", recommend.warm_start_recommendation_engine)
+    app.add_event_handler("startup", recommend.warm_start_cf_model)
+    # Neighbor table: map the saved one, recompute in the background
+    app.add_event_handler("startup", similar.warm_start_neighbor_table)
+    # ALS factors: map the saved ones, retrain in the background
+    app.add_event_handler("startup", factorized.warm_start_als_engine)
     print("✅ ALL ROUTERS LOADED!")
 except ImportError as e:
     print(f"❌ Router error: {e}")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "message": "All systems ready!"}
+    return {
+        "status": "healthy",
+        "message": "All systems ready!",
+        "behavior_ingest": behavior_buffer.metrics(),
+        "sqlite_writer": db_writer.metrics(),
+        "scoring": scoring_executor.metrics()
+    }
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -0,0 +1,76 @@
+"""
+Schema migrations
+- Ordered, numbered steps tracked in SQLite's PRAGMA user_version
+- Each step runs once on existing databases and is idempotent
+  (IF NOT EXISTS); fresh databases get the same objects from models
+"""
+
+from sqlalchemy import text
+
+CATALOG_LOG_SIZE = 10000  # catalog_changes rows kept
+
+MIGRATIONS = [
+    (1, "user_behaviors hot-query indexes + active catalog partial index", [
+        # get_user_behaviors: WHERE userid = ? (ordered by time)
+        "CREATE INDEX IF NOT EXISTS ix_user_behaviors_userid_timestamp "
+        "ON user_behaviors (userid, timestamp)",
+        # Per-product activity (views/clicks of one product)
+        "CREATE INDEX IF NOT EXISTS ix_user_behaviors_productid_action "
+        "ON user_behaviors (productid, action)",
+        # get_products / catalog scans: only active, in-stock rows are indexed
+        "CREATE INDEX IF NOT EXISTS ix_products_active_in_stock "
+        "ON products (id) WHERE isactive = 1 AND stock > 0",
+        "ANALYZE"
+    ]),
+    (2, "products_fts full-text index (FTS5) kept in sync by triggers", [
+        # External-content table: the text lives in products, FTS5 stores the index
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+        "name, description, content='products', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts (rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts (products_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN "
+        "INSERT INTO products_fts (products_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO products_fts (rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+        # Index the rows that existed before the triggers
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')"
+    ]),
+    (3, "catalog_changes log written by triggers (shared catalog version)", [
+        "CREATE TABLE IF NOT EXISTS catalog_changes ("
+        "version INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL)",
+        # Same transaction as the product write, whichever worker made it
+        "CREATE TRIGGER IF NOT EXISTS products_catalog_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO catalog_changes (product_id) VALUES (new.id); END",
+        "CREATE TRIGGER IF NOT EXISTS products_catalog_au "
+        "AFTER UPDATE OF name, productcontext, isactive, stock ON products BEGIN "
+        "INSERT INTO catalog_changes (product_id) VALUES (new.id); END",
+        "CREATE TRIGGER IF NOT EXISTS products_catalog_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO catalog_changes (product_id) VALUES (old.id); END",
+        # Bounded log: readers further behind fall back to a full rebuild
+        "CREATE TRIGGER IF NOT EXISTS catalog_changes_prune AFTER INSERT ON catalog_changes BEGIN "
+        f"DELETE FROM catalog_changes WHERE version <= new.version - {CATALOG_LOG_SIZE}; END"
+    ]),
+]
+
+def schema_version(connection):
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+def run_migrations(engine, migrations=MIGRATIONS):
+    """Apply every migration newer than the database's user_version"""
+    with engine.begin() as connection:
+        current = schema_version(connection)
+        for version, description, statements in migrations:
+            if version <= current:
+                continue
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(text(f"PRAGMA user_version = {int(version)}"))
+            current = version
+            print(f"🗄️  Applied migration {version}: {description}")
+    return current
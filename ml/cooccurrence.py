@@ -0,0 +1,231 @@
+"""
+Item-Item Co-occurrence Collaborative Filtering
+- Sparse binary user x item matrix from view/click behaviors
+- Item-item cosine over co-occurrence counts: |users(i) & users(j)| /
+  sqrt(|users(i)| * |users(j)|)
+- Bounded neighbor lists: the built base keeps the top max_candidates
+  co-occurring items per item (CSR); new behaviors add to small per-item
+  delta counters that are merged in at query time
+- Per-user recent-item lists (bounded, LRU users) drive the candidate scores
+"""
+
+from collections import Counter, OrderedDict
+import threading
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    from ml.replay import BuildReplay
+except ImportError:  # Running this file directly (python ml/cooccurrence.py)
+    from replay import BuildReplay
+
+DEFAULT_CF_ACTIONS = {'view': 1.0, 'click': 2.0}
+
+class CooccurrenceModel(BuildReplay):
+    def __init__(self, max_candidates=100, max_items_per_user=50, max_users=100000,
+                 action_weights=None):
+        """
+        Args:
+            max_candidates: Co-occurring items kept per item
+            max_items_per_user: Most recent items remembered per user (bounds
+                the work of one incremental update)
+            max_users: Users whose item lists are kept in memory (LRU)
+            action_weights: Dict of action -> weight of that item in a user's
+                candidate scoring (defaults to DEFAULT_CF_ACTIONS)
+        """
+        self.max_candidates = max_candidates
+        self.max_items_per_user = max_items_per_user
+        self.max_users = max_users
+        self.action_weights = dict(action_weights or DEFAULT_CF_ACTIONS)
+        self.is_built = False
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._item_ids = np.empty(0, dtype=np.int64)  # Base index -> product id
+        self._index_of = {}                           # product id -> base index
+        self._base = sp.csr_matrix((0, 0), dtype=np.float32)  # Pruned co-occurrence counts
+        self._base_norms = np.empty(0, dtype=np.float64)      # Users per item at build
+        self._delta = {}                              # product id -> Counter(product id -> count)
+        self._delta_norms = Counter()
+        self._users = OrderedDict()                   # user id -> OrderedDict(product id -> weight)
+        self._pending = None                          # Interactions seen while a build runs
+
+    def _prune_rows(self, counts):
+        """Keep the max_candidates largest entries of every CSR row"""
+        counts = counts.tocsr()
+        counts.sort_indices()
+        lengths = np.diff(counts.indptr)
+        keep = np.ones(counts.nnz, dtype=bool)
+        for row in np.flatnonzero(lengths > self.max_candidates):
+            start, end = counts.indptr[row], counts.indptr[row + 1]
+            order = np.argpartition(-counts.data[start:end], self.max_candidates - 1)
+            keep[start + order[self.max_candidates:]] = False
+        rows = np.repeat(np.arange(counts.shape[0]), lengths)[keep]
+        return sp.csr_matrix((counts.data[keep], (rows, counts.indices[keep])), shape=counts.shape)
+
+    def build(self, interactions):
+        """
+        Full build from behavior history
+
+        Args:
+            interactions: Iterable of (user_id, product_id, action), oldest first
+        """
+        users, items, weights = {}, {}, {}
+        for user_id, product_id, action in interactions:
+            if product_id is None or action not in self.action_weights:
+                continue
+            row = users.setdefault(str(user_id), len(users))
+            col = items.setdefault(int(product_id), len(items))
+            user_items = weights.setdefault(row, OrderedDict())
+            user_items[col] = user_items.get(col, 0.0) + self.action_weights[action]
+            user_items.move_to_end(col)
+            if len(user_items) > self.max_items_per_user:
+                user_items.popitem(last=False)
+
+        item_ids = np.fromiter(items.keys(), dtype=np.int64, count=len(items))
+        rows = np.fromiter((r for r, cols in weights.items() for _ in cols), dtype=np.int64)
+        cols = np.fromiter((c for cols in weights.values() for c in cols), dtype=np.int64)
+        matrix = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                               shape=(len(users), len(items)))
+        counts = (matrix.T @ matrix).tocsr()  # Items x items: users in common
+        norms = counts.diagonal().astype(np.float64)
+        counts.setdiag(0)
+        counts.eliminate_zeros()
+        base = self._prune_rows(counts)
+
+        # Most recently active users are kept when there are more than max_users
+        user_ids = list(users.keys())
+        user_state = OrderedDict()
+        for row in range(max(0, len(user_ids) - self.max_users), len(user_ids)):
+            user_state[user_ids[row]] = OrderedDict(
+                (int(item_ids[col]), weight) for col, weight in weights.get(row, {}).items()
+            )
+
+        with self._lock:
+            pending = self._take_pending()
+            self._reset()
+            self._item_ids = item_ids
+            self._index_of = {int(pid): i for i, pid in enumerate(item_ids)}
+            self._base = base
+            self._base_norms = norms
+            self._users = user_state
+            self.is_built = True
+            for user_id, product_id, action in pending:
+                self.add_interaction(user_id, product_id, action)
+        print(f"🤝 Built co-occurrence model: {len(items)} items, {len(users)} users, "
+              f"{base.nnz} item pairs kept")
+
+    def add_interaction(self, user_id, product_id, action):
+        """
+        Apply one new view/click: co-occurrence with every item the user already
+        has (bounded by max_items_per_user), then remember the item
+        """
+        weight = self.action_weights.get(action)
+        if product_id is None or weight is None:
+            return
+        product_id, user_id = int(product_id), str(user_id)
+        with self._lock:
+            if self._defer((user_id, product_id, action)):
+                return
+            user_items = self._users.get(user_id)
+            if user_items is None:
+                user_items = self._users[user_id] = OrderedDict()
+            self._users.move_to_end(user_id)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+            if product_id not in user_items:
+                self._delta_norms[product_id] += 1
+                new_counts = self._delta.setdefault(product_id, Counter())
+                for other in user_items:
+                    new_counts[other] += 1
+                    self._delta.setdefault(other, Counter())[product_id] += 1
+                    self._prune_delta(other)
+                self._prune_delta(product_id)
+            user_items[product_id] = user_items.get(product_id, 0.0) + weight
+            user_items.move_to_end(product_id)
+            if len(user_items) > self.max_items_per_user:
+                user_items.popitem(last=False)
+
+    def _prune_delta(self, product_id):
+        counts = self._delta[product_id]
+        if len(counts) > 2 * self.max_candidates:
+            self._delta[product_id] = Counter(dict(counts.most_common(self.max_candidates)))
+
+    def _norm(self, product_id):
+        index = self._index_of.get(product_id)
+        base = self._base_norms[index] if index is not None else 0.0
+        return base + self._delta_norms.get(product_id, 0)
+
+    def neighbors(self, product_id):
+        """
+        Co-occurring items of one product with cosine scores
+
+        Returns:
+            Dict of product id -> cosine
+        """
+        product_id = int(product_id)
+        with self._lock:
+            counts = Counter(self._delta.get(product_id, {}))
+            index = self._index_of.get(product_id)
+            if index is not None:
+                start, end = self._base.indptr[index], self._base.indptr[index + 1]
+                for col, count in zip(self._base.indices[start:end], self._base.data[start:end]):
+                    counts[int(self._item_ids[col])] += float(count)
+            norm = self._norm(product_id)
+            if not norm:
+                return {}
+            scores = {}
+            for other, count in counts.items():
+                other_norm = self._norm(other)
+                if other_norm:
+                    scores[other] = float(count / np.sqrt(norm * other_norm))
+            return scores
+
+    def set_user_items(self, user_id, behaviors):
+        """Seed a user's recent items from their history (e.g. after a cold profile load)"""
+        user_items = OrderedDict()
+        for behavior in behaviors:
+            weight = self.action_weights.get(behavior.get('action'))
+            product_id = behavior.get('productid')
+            if weight is None or product_id is None:
+                continue
+            user_items[int(product_id)] = user_items.get(int(product_id), 0.0) + weight
+            user_items.move_to_end(int(product_id))
+        while len(user_items) > self.max_items_per_user:
+            user_items.popitem(last=False)
+        with self._lock:
+            self._users[str(user_id)] = user_items
+            self._users.move_to_end(str(user_id))
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def user_items(self, user_id):
+        """The user's remembered recent items: dict of product id -> weight"""
+        with self._lock:
+            return dict(self._users.get(str(user_id), {}))
+
+    def score_user(self, user_id, max_results=200):
+        """
+        Collaborative candidate scores for a user: sum over their recent items
+        of item weight x cosine(item, candidate)
+
+        Returns:
+            Dict of product id -> score (the user's own items excluded), at most
+            max_results entries
+        """
+        with self._lock:
+            user_items = self._users.get(str(user_id))
+            if not user_items:
+                return {}
+            user_items = dict(user_items)
+        scores = Counter()
+        for product_id, weight in user_items.items():
+            for other, similarity in self.neighbors(product_id).items():
+                if other not in user_items:
+                    scores[other] += weight * similarity
+        return dict(scores.most_common(max_results))
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._users
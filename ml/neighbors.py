@@ -0,0 +1,278 @@
+"""
+Item-to-Item Neighbor Table ("similar products")
+- Top-K most similar products for EVERY product, computed offline from the
+  L2-normalized product matrix (cosine = sparse self-product)
+- Row blocks sized to a memory budget: each block's dense (rows x products)
+  scores are reduced to per-row top-k before the next block is computed
+- Stored as compact int32 neighbor ids + float32 scores (.npy, mmap-able)
+- Serving is an O(1) row lookup - no scoring per page view; inactive
+  neighbors are masked by the caller, so activity changes cost nothing
+- Catalog changes of the same fit recompute only the rows they reach (the
+  changed products' own rows, rows that listed them, rows they now enter);
+  a per-row content fingerprint skips products whose vector did not change
+"""
+
+import json
+import os
+import zlib
+import numpy as np
+
+try:
+    from ml.topk import top_k_batch
+    from ml.snapshots import reading_snapshot, write_snapshot
+except ImportError:  # Running this file directly (python ml/neighbors.py)
+    from topk import top_k_batch
+    from snapshots import reading_snapshot, write_snapshot
+
+NEIGHBORS_FORMAT = 2
+DEFAULT_NEIGHBORS = 20
+NEIGHBOR_MEMORY_BUDGET = 64 * 1024 * 1024  # Bytes of dense scores per row block
+MIN_NEIGHBOR_SCORE = 0.05
+
+def compute_neighbors(matrix, k=DEFAULT_NEIGHBORS, active=None, memory_budget=NEIGHBOR_MEMORY_BUDGET,
+                      threshold=MIN_NEIGHBOR_SCORE, rows=None):
+    """
+    Per-row top-k cosine neighbors of a row-normalized CSR matrix
+
+    Args:
+        matrix: CSR product matrix with L2-normalized rows
+        k: Neighbors kept per product
+        active: Optional bool row mask; inactive rows are never neighbors
+        memory_budget: Max bytes for one dense block of scores
+        threshold: Scores <= threshold are dropped (padded with -1)
+        rows: Optional row indices to compute (default: every row)
+
+    Returns:
+        (neighbor rows int32, scores float32), both (len(rows) x k), -1 padded
+    """
+    n_rows = matrix.shape[0]
+    rows = np.arange(n_rows) if rows is None else np.asarray(rows, dtype=np.int64)
+    k = min(k, max(n_rows - 1, 0))
+    neighbor_rows = np.full((len(rows), k), -1, dtype=np.int32)
+    neighbor_scores = np.zeros((len(rows), k), dtype=np.float32)
+    if k == 0 or not len(rows):
+        return neighbor_rows, neighbor_scores
+
+    matrix_t = matrix.T.tocsc()
+    block_size = max(1, memory_budget // (n_rows * 8))
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        scores = (matrix[block] @ matrix_t).toarray()
+        scores[np.arange(len(block)), block] = -1.0  # Not your own neighbor
+        if active is not None:
+            scores[:, ~active] = -1.0
+        top_rows, top_scores = top_k_batch(scores, k, threshold=threshold)
+        neighbor_rows[start:start + len(block)] = top_rows
+        neighbor_scores[start:start + len(block)] = np.where(top_rows >= 0, top_scores, 0.0)
+    return neighbor_rows, neighbor_scores
+
+def row_fingerprints(matrix, rows):
+    """
+    Content hash of each listed CSR row (crc32 of its columns and float32
+    values) - stable across processes, so saved tables can be compared
+    """
+    fingerprints = np.empty(len(rows), dtype=np.uint64)
+    for i, row in enumerate(rows):
+        start, stop = matrix.indptr[row], matrix.indptr[row + 1]
+        columns = zlib.crc32(np.asarray(matrix.indices[start:stop], dtype=np.int64).tobytes())
+        values = zlib.crc32(np.asarray(matrix.data[start:stop], dtype=np.float32).tobytes())
+        fingerprints[i] = (columns << 32) | values
+    return fingerprints
+
+def _neighbor_ids(product_ids, rows):
+    return np.where(rows >= 0, product_ids[np.maximum(rows, 0)], -1).astype(np.int32)
+
+class NeighborTable:
+    def __init__(self, product_ids, neighbor_ids, scores, catalog_version=None, fingerprints=None,
+                 fit_id=None):
+        """
+        Args:
+            product_ids: Product id per table row
+            neighbor_ids: int32 (n x k) neighbor product ids, -1 padded
+            scores: float32 (n x k) cosine scores
+            catalog_version: Catalog version the table was computed from
+            fingerprints: uint64 content hash of each product's vector
+            fit_id: Fit (vocabulary) of the product matrix it was computed from
+        """
+        self.product_ids = product_ids
+        self.neighbor_ids = neighbor_ids
+        self.scores = scores
+        self.catalog_version = catalog_version
+        self.fingerprints = fingerprints
+        self.fit_id = fit_id
+        self._row_of = {int(pid): row for row, pid in enumerate(product_ids)}
+
+    @classmethod
+    def build(cls, matrix, product_ids, active=None, k=DEFAULT_NEIGHBORS, catalog_version=None,
+              fit_id=None, memory_budget=NEIGHBOR_MEMORY_BUDGET):
+        """Compute the table for every active row of a product matrix"""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if len(product_ids) and product_ids.max() > np.iinfo(np.int32).max:
+            raise ValueError("Product ids do not fit the int32 neighbor table!")
+        rows = np.arange(len(product_ids)) if active is None else np.flatnonzero(active)
+        neighbor_rows, scores = compute_neighbors(matrix, k, active, memory_budget, rows=rows)
+        print(f"🧩 Built neighbor table: {len(rows)} products x {neighbor_rows.shape[1]} neighbors")
+        return cls(product_ids[rows], _neighbor_ids(product_ids, neighbor_rows), scores,
+                   catalog_version, row_fingerprints(matrix, rows), fit_id)
+
+    def updated(self, matrix, product_ids, active, changed_ids, catalog_version,
+                memory_budget=NEIGHBOR_MEMORY_BUDGET, threshold=MIN_NEIGHBOR_SCORE):
+        """
+        Table for a later catalog version of the same fit, recomputing only
+        the rows `changed_ids` reach
+
+        - Changed products that are now inactive, or whose vector did not
+          change (stock / active flag only), recompute nothing: inactive
+          neighbors are masked when serving
+        - A changed vector recomputes its own row, every row that listed the
+          product, and every row it now scores above the last neighbor of
+
+        Args:
+            matrix, product_ids, active: The engine's product matrix, row ids
+                and row mask (same fit as this table)
+            changed_ids: Product ids touched since this table's version
+
+        Returns:
+            A new NeighborTable (this one is left alone)
+        """
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        active_rows = np.flatnonzero(active)
+        matrix_row = {int(product_ids[row]): row for row in active_rows}
+
+        # Changed products with a new or different vector
+        candidates = [pid for pid in changed_ids if pid in matrix_row]
+        fingerprints = row_fingerprints(matrix, [matrix_row[pid] for pid in candidates])
+        changed = {}
+        for pid, fingerprint in zip(candidates, fingerprints):
+            row = self._row_of.get(pid)
+            if row is None or self.fingerprints[row] != fingerprint:
+                changed[pid] = fingerprint
+
+        # Append rows for products the table has not seen
+        new_ids = [pid for pid in changed if pid not in self._row_of]
+        k = self.neighbor_ids.shape[1]
+        table_ids = np.concatenate([self.product_ids, np.asarray(new_ids, dtype=np.int64)])
+        neighbor_ids = np.vstack([self.neighbor_ids, np.full((len(new_ids), k), -1, dtype=np.int32)])
+        scores = np.vstack([self.scores, np.zeros((len(new_ids), k), dtype=np.float32)])
+        table_fingerprints = np.concatenate([self.fingerprints, np.zeros(len(new_ids), dtype=np.uint64)])
+        row_of = dict(self._row_of)
+        for offset, pid in enumerate(new_ids):
+            row_of[pid] = len(self.product_ids) + offset
+        if changed:
+            affected = self._affected_rows(matrix, active, changed, matrix_row, table_ids,
+                                           neighbor_ids, scores, memory_budget, threshold)
+            table_rows = np.asarray([row_of[int(table_ids[row])] for row in affected], dtype=np.int64)
+            rows = np.asarray([matrix_row[int(table_ids[row])] for row in affected], dtype=np.int64)
+            neighbor_rows, top_scores = compute_neighbors(matrix, k, active, memory_budget,
+                                                          threshold, rows=rows)
+            width = neighbor_rows.shape[1]
+            neighbor_ids[table_rows] = -1
+            scores[table_rows] = 0.0
+            neighbor_ids[table_rows, :width] = _neighbor_ids(product_ids, neighbor_rows)
+            scores[table_rows, :width] = top_scores
+            for pid, fingerprint in changed.items():
+                table_fingerprints[row_of[pid]] = fingerprint
+            print(f"🧩 Updated neighbor table: {len(changed)} products changed, "
+                  f"{len(rows)} rows recomputed")
+        return NeighborTable(table_ids, neighbor_ids, scores, catalog_version, table_fingerprints,
+                             self.fit_id)
+
+    @staticmethod
+    def _affected_rows(matrix, active, changed, matrix_row, table_ids, neighbor_ids, scores,
+                       memory_budget, threshold):
+        """Table rows (of products active in `matrix`) the changed vectors reach"""
+        changed_ids = np.fromiter(changed, dtype=np.int64, count=len(changed))
+        listed = np.isin(neighbor_ids, changed_ids).any(axis=1)
+
+        # Best score any changed product now reaches, per matrix row
+        n_rows = matrix.shape[0]
+        best = np.full(n_rows, -1.0)
+        changed_rows = np.asarray([matrix_row[int(pid)] for pid in changed_ids], dtype=np.int64)
+        matrix_t = matrix.T.tocsc()
+        block_size = max(1, memory_budget // (n_rows * 8))
+        for start in range(0, len(changed_rows), block_size):
+            block = changed_rows[start:start + block_size]
+            block_scores = (matrix[block] @ matrix_t).toarray()
+            block_scores[np.arange(len(block)), block] = -1.0
+            np.maximum(best, block_scores.max(axis=0), out=best)
+        best[~active] = -1.0
+
+        # Last kept neighbor's score per table row (the threshold if the row has room)
+        last = np.where(neighbor_ids[:, -1] >= 0, scores[:, -1], threshold)
+        affected = []
+        for row, pid in enumerate(table_ids):
+            matrix_row_of_pid = matrix_row.get(int(pid))
+            if matrix_row_of_pid is None:
+                continue  # Inactive product: its row is kept as is
+            if int(pid) in changed or listed[row] or best[matrix_row_of_pid] > last[row]:
+                affected.append(row)
+        return affected
+
+    def similar(self, product_id, k=10):
+        """
+        Precomputed neighbors of one product (O(1) row lookup)
+
+        Args:
+            k: Neighbors wanted (None: the whole row)
+
+        Returns:
+            List of (product_id, score), best first; empty if unknown
+        """
+        row = self._row_of.get(int(product_id))
+        if row is None:
+            return []
+        ids, scores = self.neighbor_ids[row, :k], self.scores[row, :k]
+        return [(int(pid), float(score)) for pid, score in zip(ids, scores) if pid >= 0]
+
+    def save(self, path):
+        """Atomic directory write (staging dir swapped in), like the engine snapshot"""
+        def write_files(staging):
+            np.save(os.path.join(staging, 'product_ids.npy'), np.asarray(self.product_ids))
+            np.save(os.path.join(staging, 'neighbor_ids.npy'), np.asarray(self.neighbor_ids))
+            np.save(os.path.join(staging, 'scores.npy'), np.asarray(self.scores))
+            np.save(os.path.join(staging, 'fingerprints.npy'), np.asarray(self.fingerprints))
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump({'format': NEIGHBORS_FORMAT, 'catalog_version': self.catalog_version,
+                           'fit_id': self.fit_id}, f)
+
+        write_snapshot(path, write_files, prefix='.neighbors-')
+        print(f"💾 Saved neighbor table to {path}")
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Open a saved table; arrays are memory-mapped (read-only) by default"""
+        with reading_snapshot(path):
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            if manifest.get('format') != NEIGHBORS_FORMAT:
+                raise ValueError(f"Unsupported neighbor table format {manifest.get('format')}")
+            arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+                      for name in ('product_ids', 'neighbor_ids', 'scores', 'fingerprints')}
+        return cls(arrays['product_ids'], arrays['neighbor_ids'], arrays['scores'],
+                   manifest['catalog_version'], arrays['fingerprints'], manifest.get('fit_id'))
+
+    def __len__(self):
+        return len(self.product_ids)
+
+# 🧪 BUILD TIME / MEMORY CHECK (Run this file directly!)
+if __name__ == "__main__":
+    import time
+    import scipy.sparse as sp
+    from sklearn.preprocessing import normalize
+    rng = np.random.default_rng(0)
+    n_products, n_features, terms_per_product = 50000, 5000, 12
+    matrix = normalize(sp.csr_matrix(
+        (rng.random(n_products * terms_per_product),
+         (np.repeat(np.arange(n_products), terms_per_product),
+          rng.integers(0, n_features, n_products * terms_per_product))),
+        shape=(n_products, n_features)
+    ))
+    started = time.perf_counter()
+    table = NeighborTable.build(matrix, np.arange(1, n_products + 1))
+    print(f"Build: {time.perf_counter() - started:.1f}s  "
+          f"({(table.neighbor_ids.nbytes + table.scores.nbytes) / 1e6:.1f} MB stored)")
+
+    started = time.perf_counter()
+    for pid in rng.integers(1, n_products + 1, 10000):
+        table.similar(pid)
+    print(f"similar(): {(time.perf_counter() - started) / 10000 * 1000:.4f} ms per lookup")
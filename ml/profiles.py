@@ -0,0 +1,140 @@
+"""
+Per-User Interest Profile Store
+- Keeps each user's (unnormalized) weighted interest vector in memory
+- Each new behavior event is applied as one O(nnz) sparse add
+- Exponential time decay per action type via lazy scaling: every action
+  accumulator carries a scale factor + last-update time, so decaying the
+  whole history is one multiply on the scale instead of a rescan
+- LRU-bounded; evicted users are rebuilt from history on next request
+- Each profile keeps a high-water mark: how many of the user's stored
+  behaviors it has folded in (history at build time + events added since).
+  Callers that count more in the database (written by another worker)
+  treat the cached profile as a miss
+"""
+
+from collections import OrderedDict
+import threading
+import numpy as np
+
+RESCALE_BELOW = 1e-3  # Fold the scale into the accumulator before it underflows
+
+class ProfileStore:
+    def __init__(self, max_users=10000, half_lives=None):
+        """
+        Args:
+            max_users: Max profiles kept in memory (least recently used evicted)
+            half_lives: Dict of action -> half-life in seconds
+                (missing/None = that action never decays)
+        """
+        self.max_users = max_users
+        self.half_lives = dict(half_lives or {})
+        self.n_features = 0
+        # user_id -> {action: [dense float32 accumulator, scale, last_update]}
+        self._profiles = OrderedDict()
+        self._high_water = {}  # user_id -> stored behaviors folded into the profile
+        self._lock = threading.Lock()
+
+    def decay_factor(self, action, elapsed):
+        """Multiplier for a signal of `action` that is `elapsed` seconds old"""
+        half_life = self.half_lives.get(action)
+        if not half_life or elapsed <= 0:
+            return 1.0
+        return 2.0 ** (-elapsed / half_life)
+
+    def reset(self, n_features):
+        """Drop all profiles (call whenever the vocabulary changes)"""
+        with self._lock:
+            self.n_features = n_features
+            self._profiles.clear()
+            self._high_water.clear()
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._profiles
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def put(self, user_id, vectors_by_action, at, high_water=None):
+        """
+        Store a freshly built profile
+
+        Args:
+            vectors_by_action: Dict of action -> unnormalized vector (dense or
+                1 x V sparse) with weights already decayed to time `at`
+            at: Epoch seconds the vectors are valid at
+            high_water: Number of the user's stored behaviors folded into
+                the vectors (None = unknown, never considered stale)
+        """
+        state = {}
+        for action, vector in vectors_by_action.items():
+            if hasattr(vector, 'toarray'):
+                vector = vector.toarray()
+            accumulator = np.asarray(vector, dtype=np.float32).ravel().copy()
+            if accumulator.shape[0] != self.n_features:
+                raise ValueError("Profile size does not match the vocabulary!")
+            state[action] = [accumulator, 1.0, at]
+        with self._lock:
+            self._profiles[str(user_id)] = state
+            self._high_water[str(user_id)] = high_water
+            self._profiles.move_to_end(str(user_id))
+            if len(self._profiles) > self.max_users:
+                evicted, _ = self._profiles.popitem(last=False)
+                self._high_water.pop(evicted, None)
+
+    def add(self, user_id, action, vector, weight, at):
+        """
+        Apply one behavior event: profile[action] = decay * profile[action] + weight * vector
+
+        Args:
+            vector: 1 x V sparse row (product row or query vector)
+            weight: Action weight
+            at: Event time in epoch seconds
+
+        Returns:
+            False if the user has no cached profile (it will be built from the
+            full history on the next request instead)
+        """
+        with self._lock:
+            state = self._profiles.get(str(user_id))
+            if state is None:
+                return False
+            entry = state.get(action)
+            if entry is None:
+                entry = state[action] = [np.zeros(self.n_features, dtype=np.float32), 1.0, at]
+            accumulator, scale, last_update = entry
+
+            # Lazy decay: age the scale, not the vector
+            if at >= last_update:
+                scale *= self.decay_factor(action, at - last_update)
+                entry[2] = at
+            else:  # Late event - decay it to the accumulator's time instead
+                weight *= self.decay_factor(action, last_update - at)
+            if scale < RESCALE_BELOW:
+                accumulator *= scale
+                scale = 1.0
+            entry[1] = scale
+
+            np.add.at(accumulator, vector.indices, (weight / scale) * vector.data)
+            if self._high_water.get(str(user_id)) is not None:
+                self._high_water[str(user_id)] += 1
+            self._profiles.move_to_end(str(user_id))
+            return True
+
+    def get(self, user_id, now, high_water=None):
+        """
+        L2-normalized dense profile as of `now`, or None if the user is not
+        cached (or has folded in fewer than `high_water` stored behaviors)
+        """
+        with self._lock:
+            state = self._profiles.get(str(user_id))
+            if state is None:
+                return None
+            built_from = self._high_water.get(str(user_id))
+            if high_water and (built_from is None or built_from < high_water):
+                return None  # Newer behaviors in the DB (e.g. from another worker)
+            self._profiles.move_to_end(str(user_id))
+            profile = np.zeros(self.n_features, dtype=np.float64)
+            for action, (accumulator, scale, last_update) in state.items():
+                profile += (scale * self.decay_factor(action, now - last_update)) * accumulator
+            norm = np.linalg.norm(profile)
+            return profile / norm if norm else profile
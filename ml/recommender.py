@@ -1,148 +1,995 @@
 """
 Pure ML Recommendation Engine
-- Builds user interest profiles from behavior
+- Builds user interest profiles as weighted sums of cached product/query vectors
+- Keeps per-user profiles in memory, updated by one sparse add per event
+- Exponential time decay with a configurable half-life per action type
 - TF-IDF vectorization
-- Cosine similarity matching
+- Cached, L2-normalized product matrix (built once per catalog version),
+  published as one immutable CatalogIndex that scoring captures per request
+- Incremental re-indexing of changed products with the existing vocabulary
+- Cosine similarity matching (one sparse mat-vec per request)
+- Opt-in IVF candidate index for large catalogs (exact re-scoring of probed lists)
+- Free-text semantic search over the same product matrix (LRU-cached query vectors)
+- Optional blending with collaborative (co-occurrence) candidate scores
+- Versioned on-disk snapshots (.npy arrays, opened zero-copy with mmap)
 - Returns top product recommendations
 """
 
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+import json
+import os
+import threading
+import time
+import uuid
+from sklearn.base import clone
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+import scipy.sparse as sp
 import numpy as np
 
+try:
+    from ml.topk import top_k, top_k_batch
+    from ml.profiles import ProfileStore
+    from ml.ann import IVFIndex
+    from ml.snapshots import reading_snapshot, write_snapshot
+except ImportError:  # Running this file directly (python ml/recommender.py)
+    from topk import top_k, top_k_batch
+    from profiles import ProfileStore
+    from ann import IVFIndex
+    from snapshots import reading_snapshot, write_snapshot
+
+MIN_RELEVANCE = 0.1  # Minimum cosine score for a recommendation
+BATCH_MEMORY_BUDGET = 64 * 1024 * 1024  # Bytes of dense scores per batch chunk
+
+# Default signal strength per behavior type
+DEFAULT_ACTION_WEIGHTS = {
+    'search': 3.0,   # Most explicit user intent
+    'click': 2.0,    # Strong engagement signal
+    'view': 1.0      # Passive interest
+}
+
+# Default half-life (seconds) per behavior type - None disables decay
+DAY = 24 * 60 * 60
+DEFAULT_HALF_LIVES = {
+    'search': 7 * DAY,    # Search intent goes stale fastest
+    'click': 30 * DAY,
+    'view': 30 * DAY
+}
+
+SNAPSHOT_FORMAT = 2  # Bump whenever the on-disk layout changes
+SNAPSHOT_VECTORIZER_PARAMS = ('max_features', 'stop_words', 'min_df', 'max_df', 'ngram_range')
+
+def to_epoch_seconds(timestamp):
+    """datetime (naive = UTC, as stored by UserBehavior) / epoch number / None → epoch seconds"""
+    if timestamp is None:
+        return time.time()
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        return timestamp.timestamp()
+    return float(timestamp)
+
+def _published(name):
+    """Engine attribute forwarded to the published CatalogIndex (None before fit)"""
+    return property(lambda self: getattr(self.index, name, None))
+
+class LRUCache:
+    """Thread-safe LRU map (text → vector), shared by concurrent scoring threads"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._items)
+
+class CatalogIndex:
+    """
+    One published, read-only view of the indexed catalog
+    
+    The engine swaps a new CatalogIndex in with a single attribute assignment
+    and readers capture engine.index once per request, so a concurrent sync
+    or refit can never hand them arrays of two different versions. Nothing
+    reachable from a published index is mutated afterwards - updates build
+    copies. The vocabulary-bound caches (text/query vectors, user profiles)
+    are shared by every index built on the same fitted vectorizer.
+    """
+    __slots__ = ('vectorizer', 'vocabulary', 'product_matrix', 'product_ids', 'product_active',
+                 'row_of', 'catalog_version', 'ann_index', 'text_vectors', 'query_vectors',
+                 'profiles', 'baseline_oov_ratio', 'added_terms', 'added_oov_terms', 'fit_id')
+    
+    def __init__(self, vectorizer, vocabulary, text_vectors, query_vectors, profiles,
+                 baseline_oov_ratio=0.0, product_matrix=None, product_ids=None,
+                 product_active=None, row_of=None, catalog_version=None, ann_index=None,
+                 added_terms=0, added_oov_terms=0, fit_id=None):
+        self.vectorizer = vectorizer              # Fitted; never refit in place
+        self.fit_id = fit_id                      # Identifies the vocabulary (shared by snapshots of it)
+        self.vocabulary = vocabulary
+        self.text_vectors = text_vectors          # LRUCache: context/query text -> 1 x V CSR
+        self.query_vectors = query_vectors        # LRUCache: normalized search query -> 1 x V CSR
+        self.profiles = profiles                  # ProfileStore sized to this vocabulary
+        self.baseline_oov_ratio = baseline_oov_ratio
+        self.product_matrix = product_matrix      # CSR, one L2-normalized row per product
+        self.product_ids = product_ids            # Product id for each matrix row
+        self.product_active = product_active      # Row mask (False = removed/deactivated)
+        self.row_of = row_of if row_of is not None else {}  # product_id -> matrix row
+        self.catalog_version = catalog_version
+        self.ann_index = ann_index                # IVFIndex over product_matrix rows (large catalogs)
+        self.added_terms = added_terms            # Vocabulary drift since the fit
+        self.added_oov_terms = added_oov_terms
+    
+    def replace(self, **changes):
+        """Copy with some fields swapped - the next index to publish"""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return CatalogIndex(**fields)
+
 class RecommenderEngine:
-    def __init__(self):
-        """Initialize TF-IDF vectorizer with optimal settings"""
-        self.vectorizer = TfidfVectorizer(
+    def __init__(self, oov_refit_threshold=0.3, action_weights=None, text_cache_size=10000,
+                 profile_cache_size=10000, half_lives=None, ann_min_products=None, ann_n_probe=8,
+                 query_cache_size=10000, oov_min_terms=200):
+        """
+        Initialize TF-IDF vectorizer with optimal settings
+        
+        Args:
+            oov_refit_threshold: How far the out-of-vocabulary term ratio of
+                incrementally added products may drift above the fit-time
+                baseline before update_products() asks for a full refit
+            action_weights: Dict of action -> profile weight
+                (defaults to DEFAULT_ACTION_WEIGHTS)
+            text_cache_size: Max cached query/context vectors (LRU)
+            profile_cache_size: Max per-user profiles kept in memory (LRU)
+            half_lives: Dict of action -> half-life in seconds
+                (defaults to DEFAULT_HALF_LIVES; None values disable decay)
+            ann_min_products: Build an IVF candidate index at fit time once the
+                catalog has this many products (None, the default, disables
+                ANN: at 100k products n_probe=8 gives recall@10 0.78 and
+                reaching ~0.94 costs more than the exact scan)
+            ann_n_probe: IVF lists probed per query
+            query_cache_size: Max cached search query vectors (LRU)
+            oov_min_terms: Terms added since the fit before their OOV ratio
+                is trusted (a few new products never force a refit)
+        """
+        # Template only: every (re)fit clones it, so a published vectorizer is
+        # never refit under a scoring thread
+        self._vectorizer = TfidfVectorizer(
             max_features=1000,        # Top 1000 words
             stop_words='english',     # Remove common words
             min_df=2,                 # Word must appear in 2+ products
             max_df=0.8,               # Ignore words in 80%+ products
             ngram_range=(1, 2)        # Single words + 2-word phrases
         )
-        self.is_fitted = False
-        self.vocabulary = None
+        
+        # Cached catalog state, replaced whole on every fit/update (see CatalogIndex)
+        self.index = None
+        self.ann_min_products = ann_min_products
+        self.ann_n_probe = ann_n_probe
+        
+        # Vocabulary drift tracking for incremental updates
+        self.oov_refit_threshold = oov_refit_threshold
+        self.oov_min_terms = oov_min_terms
+        
+        # Profile building
+        self.action_weights = dict(action_weights or DEFAULT_ACTION_WEIGHTS)
+        self.text_cache_size = text_cache_size
+        self.profile_cache_size = profile_cache_size
+        self.half_lives = dict(DEFAULT_HALF_LIVES if half_lives is None else half_lives)
+        
+        # Search
+        self.query_cache_size = query_cache_size
+    
+    # Single reads of the published index (code using several fields together
+    # captures self.index once instead)
+    vocabulary = _published('vocabulary')
+    product_matrix = _published('product_matrix')
+    product_ids = _published('product_ids')
+    product_active = _published('product_active')
+    catalog_version = _published('catalog_version')
+    ann_index = _published('ann_index')
+    profiles = _published('profiles')
     
-    def fit(self, product_contexts):
-        """Train vectorizer on all product contexts (vocabulary + IDF scores)"""
+    @property
+    def is_fitted(self):
+        return self.index is not None
+    
+    @property
+    def vectorizer(self):
+        index = self.index
+        return index.vectorizer if index is not None else self._vectorizer
+    
+    def _current(self, index=None):
+        """The index one call works on: the caller's captured one, else the published one"""
+        index = self.index if index is None else index
+        if index is None or index.product_matrix is None:
+            raise ValueError("Must call fit() first with product contexts!")
+        return index
+    
+    def fit(self, product_contexts, product_ids=None, catalog_version=None):
+        """Train a fresh vectorizer on all product contexts (vocabulary + IDF scores)"""
         if not product_contexts:
             raise ValueError("No product contexts provided!")
         
-        self.vectorizer.fit(product_contexts)
-        self.is_fitted = True
-        self.vocabulary = self.vectorizer.get_feature_names_out()
-        print(f"✅ Fitted with vocabulary size: {len(self.vocabulary)} words")
+        vectorizer = clone(self._vectorizer).fit(product_contexts)
+        index = self._fitted_index(vectorizer, product_contexts[:1000])
+        self.index = self._indexed(index, product_contexts, product_ids, catalog_version)
     
-    def build_interest_profile(self, behaviors):
+    def fit_from_stream(self, make_stream, catalog_version=None, chunk_size=10000):
         """
-        Convert user behaviors → interest text with proper weighting
+        Fit + index a catalog too large to hold as Python lists
+        
+        The previous index keeps serving until the new one is published.
         
         Args:
-            behaviors: List of dicts:
-                {'action': 'search', 'searchquery': 'wireless headphones'}
-                {'action': 'view', 'productcontext': 'wireless bluetooth gym'}
+            make_stream: Callable returning a fresh iterator of
+                (product_id, product_context); called twice (vocabulary pass,
+                then vectorization pass)
+            catalog_version: Token identifying this catalog state
+            chunk_size: Contexts vectorized per block in the second pass
+        """
+        n_seen = 0
+        def contexts():
+            nonlocal n_seen
+            for _, context in make_stream():
+                n_seen += 1
+                yield context
+        
+        # Pass 1: vocabulary + IDF (sklearn keeps only sparse counts, not the texts)
+        vectorizer = clone(self._vectorizer).fit(contexts())
+        if not n_seen:
+            raise ValueError("No product contexts provided!")
+        
+        # Pass 2: vectorize block by block
+        blocks, product_ids, sample, chunk_ids, chunk = [], [], [], [], []
+        for product_id, context in make_stream():
+            chunk_ids.append(product_id)
+            chunk.append(context)
+            if len(sample) < 1000:
+                sample.append(context)
+            if len(chunk) == chunk_size:
+                blocks.append(vectorizer.transform(chunk))
+                product_ids.extend(chunk_ids)
+                chunk_ids, chunk = [], []
+        if chunk:
+            blocks.append(vectorizer.transform(chunk))
+            product_ids.extend(chunk_ids)
+        
+        index = self._fitted_index(vectorizer, sample)
+        self.index = self._with_matrix(index, sp.vstack(blocks, format='csr'), product_ids, catalog_version)
+    
+    def _fitted_index(self, vectorizer, sample_contexts):
+        """Empty index for a freshly fitted vocabulary (new caches - the old ones belong to the old vocabulary)"""
+        vocabulary = vectorizer.get_feature_names_out()
+        print(f"✅ Fitted with vocabulary size: {len(vocabulary)} words")
+        
+        # Terms dropped by min_df/max_df/max_features are "OOV" even in the
+        # training corpus - measure that baseline on a sample
+        oov, total = self._count_oov_terms(vectorizer, sample_contexts)
+        profiles = ProfileStore(max_users=self.profile_cache_size, half_lives=self.half_lives)
+        profiles.reset(len(vocabulary))
+        return CatalogIndex(
+            vectorizer, vocabulary, LRUCache(self.text_cache_size), LRUCache(self.query_cache_size),
+            profiles, baseline_oov_ratio=oov / total if total else 0.0, fit_id=uuid.uuid4().hex
+        )
+    
+    @staticmethod
+    def catalog_fingerprint(product_contexts):
+        """Cheap version token for callers that don't track catalog versions"""
+        return hash(tuple(product_contexts))
+    
+    def build_product_matrix(self, product_contexts, product_ids=None, catalog_version=None):
+        """
+        Vectorize the catalog once (current vocabulary) and publish it for scoring
+        
+        Args:
+            product_contexts: List of ALL active product contexts
+            product_ids: Product id for each context (defaults to list positions)
+            catalog_version: Token identifying this catalog state
+        """
+        if self.index is None:
+            raise ValueError("Must call fit() first with product contexts!")
+        self.index = self._indexed(self.index, product_contexts, product_ids, catalog_version)
+    
+    def _indexed(self, index, product_contexts, product_ids, catalog_version):
+        """`index` with the given catalog vectorized as its scoring matrix"""
+        if product_ids is None:
+            product_ids = range(len(product_contexts))
+        if len(product_ids) != len(product_contexts):
+            raise ValueError("product_ids and product_contexts must have the same length!")
+        if catalog_version is None:
+            catalog_version = self.catalog_fingerprint(product_contexts)
+        return self._with_matrix(index, index.vectorizer.transform(product_contexts), product_ids,
+                                 catalog_version)
+    
+    def _with_matrix(self, index, matrix, product_ids, catalog_version):
+        """`index` with a vectorized catalog installed as the scoring matrix (not yet published)"""
+        product_matrix = normalize(matrix, norm='l2', copy=False).tocsr()
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        print(f"📦 Cached product matrix: {product_matrix.shape[0]} products "
+              f"(catalog version {catalog_version})")
+        
+        ann_index = None
+        if self.ann_min_products is not None and len(product_ids) >= self.ann_min_products:
+            ann_index = IVFIndex(n_probe=self.ann_n_probe)
+            ann_index.build(product_matrix)
+        return index.replace(
+            product_matrix=product_matrix,
+            product_ids=product_ids,
+            product_active=np.ones(len(product_ids), dtype=bool),
+            row_of={int(pid): row for row, pid in enumerate(product_ids)},
+            catalog_version=catalog_version,
+            ann_index=ann_index
+        )
+    
+    def ensure_product_matrix(self, product_contexts, product_ids=None, catalog_version=None):
+        """Rebuild the cached product matrix only if the catalog changed"""
+        if catalog_version is None:
+            catalog_version = self.catalog_fingerprint(product_contexts)
+        if self.product_matrix is None or catalog_version != self.catalog_version:
+            self.build_product_matrix(product_contexts, product_ids, catalog_version)
+    
+    @staticmethod
+    def _count_oov_terms(vectorizer, product_contexts):
+        """Count (out-of-vocabulary, total) unigram terms in the given contexts"""
+        analyzer = vectorizer.build_analyzer()
+        vocabulary = vectorizer.vocabulary_
+        oov = total = 0
+        for context in product_contexts:
+            terms = [t for t in analyzer(context) if ' ' not in t]
+            total += len(terms)
+            oov += sum(1 for t in terms if t not in vocabulary)
+        return oov, total
+    
+    @property
+    def oov_ratio(self):
+        """OOV term ratio of products added since the last fit"""
+        index = self.index
+        if index is None or not index.added_terms:
+            return 0.0
+        return index.added_oov_terms / index.added_terms
+    
+    def update_products(self, product_ids, product_contexts, removed_ids=(), catalog_version=None):
+        """
+        Incrementally re-index changed products using the existing vocabulary
+        
+        Builds the next index beside the published one (copy-on-write arrays)
+        and publishes it with one assignment; scoring never sees a partial update.
+        
+        Args:
+            product_ids: Ids of products to (re-)add as active rows
+            product_contexts: Context for each id in product_ids
+            removed_ids: Ids of products to mask out (deactivated/out of stock)
+            catalog_version: Catalog version after these changes
         
         Returns:
-            Single text string representing user interests
+            True if applied, False if vocabulary drift crossed
+            oov_refit_threshold and the caller should fit() the full catalog
+        """
+        index = self._current()
+        if len(product_ids) != len(product_contexts):
+            raise ValueError("product_ids and product_contexts must have the same length!")
+        
+        oov, total = self._count_oov_terms(index.vectorizer, product_contexts)
+        added_terms = index.added_terms + total
+        added_oov_terms = index.added_oov_terms + oov
+        if (added_terms >= max(self.oov_min_terms, 1)
+                and added_oov_terms / added_terms - index.baseline_oov_ratio > self.oov_refit_threshold):
+            print(f"🔁 OOV ratio {added_oov_terms / added_terms:.2f} crossed refit threshold")
+            return False
+        
+        # Mask removed rows and stale rows of re-added products
+        product_matrix, ids, ann_index = index.product_matrix, index.product_ids, index.ann_index
+        active = index.product_active.copy()
+        row_of = dict(index.row_of)
+        for product_id in list(removed_ids) + list(product_ids):
+            row = row_of.pop(int(product_id), None)
+            if row is not None:
+                active[row] = False
+        
+        # Append fresh rows for (re-)added products
+        if product_ids:
+            new_rows = normalize(index.vectorizer.transform(product_contexts), norm='l2', copy=False)
+            start = product_matrix.shape[0]
+            product_matrix = sp.vstack([product_matrix, new_rows], format='csr')
+            ids = np.concatenate([ids, np.asarray(product_ids, dtype=np.int64)])
+            active = np.concatenate([active, np.ones(len(product_ids), dtype=bool)])
+            for offset, product_id in enumerate(product_ids):
+                row_of[int(product_id)] = start + offset
+            if ann_index is not None:
+                ann_index = ann_index.add(new_rows)
+        
+        updated = index.replace(
+            product_matrix=product_matrix, product_ids=ids, product_active=active, row_of=row_of,
+            ann_index=ann_index, catalog_version=catalog_version,
+            added_terms=added_terms, added_oov_terms=added_oov_terms
+        )
+        # Drop masked rows once they make up half the matrix
+        if (~active).sum() * 2 > len(active):
+            updated = self._compacted(updated)
+        self.index = updated
+        print(f"➕ Re-indexed {len(product_ids)} products, masked {len(removed_ids)} "
+              f"(catalog version {catalog_version})")
+        return True
+    
+    @staticmethod
+    def _compacted(index):
+        """Copy of `index` with the masked rows physically removed"""
+        keep = np.flatnonzero(index.product_active)
+        product_ids = index.product_ids[keep]
+        return index.replace(
+            product_matrix=index.product_matrix[keep],
+            product_ids=product_ids,
+            product_active=np.ones(len(keep), dtype=bool),
+            row_of={int(pid): row for row, pid in enumerate(product_ids)},
+            ann_index=index.ann_index.keep(keep) if index.ann_index is not None else None
+        )
+    
+    def save(self, path, index=None):
+        """
+        Write a versioned snapshot directory of the fitted engine
+        
+        Arrays are raw .npy files so load() can memory-map them; the
+        directory is written next to `path` and swapped in atomically, so
+        concurrent readers never see a half-written snapshot.
+        
+        Args:
+            path: Snapshot directory
+            index: Captured CatalogIndex to write (defaults to the published one)
+        """
+        index = self._current(index)
+        
+        # Masked rows are dropped so the snapshot holds only live products
+        # (from a copy - the published index is left alone)
+        if not index.product_active.all():
+            index = self._compacted(index)
+        
+        def write_files(staging):
+            arrays = {
+                'idf': index.vectorizer.idf_,
+                'data': index.product_matrix.data,
+                'indices': index.product_matrix.indices,
+                'indptr': index.product_matrix.indptr,
+                'product_ids': index.product_ids
+            }
+            if index.ann_index is not None:
+                arrays['ann_centroids'] = index.ann_index.centroids
+                arrays['ann_assignments'] = index.ann_index.assignments
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array))
+            
+            with open(os.path.join(staging, 'vocabulary.json'), 'w') as f:
+                json.dump(index.vocabulary.tolist(), f)
+            params = index.vectorizer.get_params()
+            manifest = {
+                'format': SNAPSHOT_FORMAT,
+                'created_at': time.time(),
+                'catalog_version': index.catalog_version,
+                'fit_id': index.fit_id,
+                'shape': list(index.product_matrix.shape),
+                'vectorizer': {name: params[name] for name in SNAPSHOT_VECTORIZER_PARAMS},
+                'baseline_oov_ratio': index.baseline_oov_ratio,
+                'added_terms': index.added_terms,  # Drift since the fit carries over to loaders
+                'added_oov_terms': index.added_oov_terms,
+                'ann_n_probe': index.ann_index.n_probe if index.ann_index is not None else None
+            }
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump(manifest, f, indent=2)
+        
+        write_snapshot(path, write_files)
+        print(f"💾 Saved snapshot to {path} ({index.product_matrix.shape[0]} products)")
+    
+    def load(self, path, mmap_mode='r'):
+        """
+        Open a snapshot written by save() and publish it
+        
+        With mmap_mode='r' the CSR arrays, IDF vector and ids are mapped
+        read-only: workers share the pages through the OS page cache and
+        startup cost is independent of catalog size. Incremental updates
+        copy-on-append, so the files on disk are never modified.
+        
+        Re-opening a snapshot of the fit already published (a later catalog
+        version) swaps in its arrays and keeps the cached profiles.
+        """
+        with reading_snapshot(path):  # Not while a writer swaps the directory
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            if manifest.get('format') != SNAPSHOT_FORMAT:
+                raise ValueError(f"Unsupported snapshot format {manifest.get('format')} "
+                                 f"(expected {SNAPSHOT_FORMAT})")
+            
+            def array(name):
+                return np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode)
+            
+            with open(os.path.join(path, 'vocabulary.json')) as f:
+                vocabulary = json.load(f)
+            params = dict(manifest['vectorizer'])
+            params['ngram_range'] = tuple(params['ngram_range'])
+            vectorizer = TfidfVectorizer(**params)
+            vectorizer.vocabulary_ = {term: i for i, term in enumerate(vocabulary)}
+            vectorizer.idf_ = array('idf')
+            vocabulary = np.asarray(vocabulary, dtype=object)
+            
+            product_matrix = sp.csr_matrix(
+                (array('data'), array('indices'), array('indptr')),
+                shape=tuple(manifest['shape'])
+            )
+            product_ids = array('product_ids')
+            
+            ann_index = None
+            if manifest.get('ann_n_probe') is not None:
+                ann_index = IVFIndex(n_probe=manifest['ann_n_probe'])
+                ann_index.centroids = array('ann_centroids')
+                ann_index.assignments = array('ann_assignments')
+                ann_index._rebuild_lists()
+        
+        catalog = dict(
+            product_matrix=product_matrix,
+            product_ids=product_ids,
+            product_active=np.ones(len(product_ids), dtype=bool),
+            row_of={int(pid): row for row, pid in enumerate(product_ids)},
+            catalog_version=manifest['catalog_version'],
+            ann_index=ann_index,
+            added_terms=manifest.get('added_terms', 0),
+            added_oov_terms=manifest.get('added_oov_terms', 0)
+        )
+        current = self.index
+        if current is not None and current.fit_id == manifest['fit_id']:
+            # Same fit: keep the vocabulary-bound caches (profiles, text vectors)
+            self.index = current.replace(**catalog)
+        else:
+            profiles = ProfileStore(max_users=self.profile_cache_size, half_lives=self.half_lives)
+            profiles.reset(len(vocabulary))
+            self.index = CatalogIndex(
+                vectorizer, vocabulary, LRUCache(self.text_cache_size), LRUCache(self.query_cache_size),
+                profiles, baseline_oov_ratio=manifest['baseline_oov_ratio'], fit_id=manifest['fit_id'],
+                **catalog
+            )
+        print(f"📂 Loaded snapshot {path} ({product_matrix.shape[0]} products, "
+              f"vocabulary {len(vocabulary)})")
+    
+    @staticmethod
+    def _text_vector(index, text):
+        """L2-normalized TF-IDF vector for a query/context, LRU-cached"""
+        vector = index.text_vectors.get(text)
+        if vector is None:
+            vector = normalize(index.vectorizer.transform([text]), norm='l2')
+            index.text_vectors.put(text, vector)
+        return vector
+    
+    def _behavior_signal(self, index, behavior):
+        """
+        Map one behavior to ('row', matrix_row) or ('text', text) plus its weight
+        Returns None for behaviors that carry no usable signal.
+        """
+        weight = self.action_weights.get(behavior['action'], 0.0)
+        if not weight:
+            return None
+        if behavior['action'] == 'search':
+            if behavior.get('searchquery'):
+                return 'text', behavior['searchquery'], weight
+            return None
+        row = index.row_of.get(behavior.get('productid'))
+        if row is not None:
+            return 'row', row, weight
+        if behavior.get('productcontext'):
+            return 'text', behavior['productcontext'], weight
+        return None
+    
+    def _profile_sums(self, index, behaviors, now=None):
+        """
+        Unnormalized weighted interest vector per action type
+        
+        Each behavior's weight is decayed from its 'timestamp' to `now`
+        (behaviors without a timestamp count as fresh).
+        
+        Returns:
+            Dict of action -> 1 x V sparse vector (empty if there is no signal)
         """
         if not behaviors:
-            return ""
+            return {}
+        now = to_epoch_seconds(now)
+        
+        # Aggregate decayed weights per (action, distinct product row / text) first
+        row_weights = {}
+        text_weights = {}
+        for behavior in behaviors:
+            signal = self._behavior_signal(index, behavior)
+            if signal is None:
+                continue
+            kind, key, weight = signal
+            action = behavior['action']
+            if behavior.get('timestamp') is not None:
+                age = now - to_epoch_seconds(behavior['timestamp'])
+                weight *= index.profiles.decay_factor(action, age)
+            target = row_weights if kind == 'row' else text_weights
+            target.setdefault(action, Counter())[key] += weight
+        
+        sums = {}
+        for action in set(row_weights) | set(text_weights):
+            parts = []
+            rows_for_action = row_weights.get(action)
+            if rows_for_action:
+                rows = np.fromiter(rows_for_action.keys(), dtype=np.int64, count=len(rows_for_action))
+                weights = np.fromiter(rows_for_action.values(), dtype=np.float64, count=len(rows_for_action))
+                parts.append(sp.csr_matrix(weights[None, :]) @ index.product_matrix[rows])
+            texts_for_action = text_weights.get(action)
+            if texts_for_action:
+                weights = np.fromiter(texts_for_action.values(), dtype=np.float64, count=len(texts_for_action))
+                vectors = sp.vstack([self._text_vector(index, text) for text in texts_for_action], format='csr')
+                parts.append(sp.csr_matrix(weights[None, :]) @ vectors)
+            sums[action] = parts[0] if len(parts) == 1 else parts[0] + parts[1]
+        
+        if sums:
+            n_rows = sum(len(c) for c in row_weights.values())
+            n_texts = sum(len(c) for c in text_weights.values())
+            print(f"📝 Built interest profile ({n_rows} products, {n_texts} texts, "
+                  f"{len(sums)} action types)")
+        return sums
+    
+    def build_interest_profile(self, behaviors, now=None, index=None):
+        """
+        Convert user behaviors → weighted, time-decayed interest vector
         
-        interest_parts = []
+        Args:
+            behaviors: List of dicts:
+                {'action': 'search', 'searchquery': 'wireless headphones', 'timestamp': ...}
+                {'action': 'view', 'productid': 7, 'productcontext': 'wireless bluetooth gym'}
+                (productcontext is only used for products not in the cached matrix)
+            now: Time the profile is evaluated at (defaults to the current time)
+            index: Captured CatalogIndex (defaults to the published one)
         
-        # 🔹 SEARCHES (Weight 3x) - Most explicit user intent
-        searches = [b for b in behaviors if b['action'] == 'search']
-        for search in searches:
-            interest_parts.extend([search['searchquery']] * 3)
+        Returns:
+            L2-normalized 1 x V sparse vector, or None if there is no signal.
+            Cost is one sparse add per distinct product/query - no text is
+            re-tokenized for catalog products or previously seen queries.
+        """
+        sums = self._profile_sums(self._current(index), behaviors, now)
+        if not sums:
+            return None
+        profile = sum(sums.values())
+        if profile.nnz == 0:
+            return None
+        return normalize(profile, norm='l2', copy=False)
+    
+    def record_behavior(self, user_id, behavior):
+        """
+        Apply one new behavior event to the user's cached profile (O(nnz))
         
-        # 🔹 CLICKS (Weight 2x) - Strong engagement signal
-        clicks = [b for b in behaviors if b['action'] == 'click']
-        for click in clicks:
-            interest_parts.extend([click['productcontext']] * 2)
+        Returns:
+            True if a cached profile was updated; users without one get their
+            profile built from the full history on their next request
+        """
+        index = self.index
+        if index is None or index.product_matrix is None:
+            return False
+        signal = self._behavior_signal(index, behavior)
+        if signal is None:
+            return False
+        kind, key, weight = signal
+        vector = index.product_matrix[key] if kind == 'row' else self._text_vector(index, key)
+        return index.profiles.add(
+            user_id, behavior['action'], vector, weight,
+            to_epoch_seconds(behavior.get('timestamp'))
+        )
+    
+    def cached_profile(self, user_id, now=None, index=None, high_water=None):
+        """
+        Profile from the store only (None on a miss) - lets async callers load
+        history themselves. A profile that folded in fewer than `high_water`
+        stored behaviors (others were written by another worker) counts as a miss.
+        """
+        index = self.index if index is None else index
+        if index is None:
+            return None
+        return index.profiles.get(user_id, to_epoch_seconds(now), high_water)
+    
+    def build_user_profile(self, user_id, behaviors, now=None, index=None, high_water=None):
+        """
+        Build, cache and return a user's profile from their full behavior
+        history (`high_water`: how many stored behaviors it contains)
+        """
+        index = self._current(index)
+        now = to_epoch_seconds(now)
+        sums = self._profile_sums(index, behaviors, now)
+        if not sums:
+            return None
+        index.profiles.put(user_id, sums, now, high_water)
+        return index.profiles.get(user_id, now)
+    
+    def recommend_from_profile(self, user_vector, top_n=5, index=None):
+        """Score a ready profile vector (dense or 1 x V sparse) against the catalog"""
+        index = self._current(index)
         
-        # 🔹 VIEWS (Weight 1x) - Passive interest
-        views = [b for b in behaviors if b['action'] == 'view']
-        for view in views:
-            interest_parts.append(view['productcontext'])
+        if sp.issparse(user_vector):
+            user_vector = user_vector.toarray()
+        user_vector = np.asarray(user_vector, dtype=np.float64).ravel()
         
-        # Combine all with spaces
-        interest_text = " ".join(interest_parts).strip()
-        print(f"📝 Built interest profile ({len(interest_parts)} signals):")
-        print(f"   '{interest_text[:100]}...'")
+        if index.ann_index is not None:
+            # Large catalog: exact cosine only over the probed IVF lists
+            rows = index.ann_index.candidates(user_vector)
+            similarities = index.product_matrix[rows] @ user_vector
+            similarities[~index.product_active[rows]] = 0.0
+            top_indices, top_scores = top_k(similarities, top_n, threshold=MIN_RELEVANCE)
+            top_indices = rows[top_indices]
+        else:
+            # Cosine similarities = one sparse mat-vec (rows are L2-normalized)
+            similarities = index.product_matrix @ user_vector
+            similarities[~index.product_active] = 0.0
+            
+            # Top N recommendations (partial selection + threshold mask)
+            top_indices, top_scores = top_k(similarities, top_n, threshold=MIN_RELEVANCE)
+        recommendations = self._format_recommendations(index, top_indices, top_scores)
         
-        return interest_text
+        print(f"🎯 Found {len(recommendations)} recommendations (max {top_n})")
+        return recommendations
     
-    def get_recommendations(self, user_behaviors, product_contexts, top_n=5):
+    def recommend_blended(self, user_vector, cf_scores, top_n=5, cf_weight=0.3, content_candidates=None,
+                          index=None):
+        """
+        Blend content (TF-IDF cosine) and collaborative scores
+        
+        score = (1 - cf_weight) * cosine + cf_weight * cf / max(cf)
+        
+        Args:
+            user_vector: Profile vector (dense or 1 x V sparse)
+            cf_scores: Dict of product id -> collaborative score (any scale)
+            top_n: Number of recommendations
+            cf_weight: Share of the collaborative signal (0 = content only)
+            content_candidates: Content top-k size merged with the CF
+                candidates (defaults to 4 x top_n)
+            index: Captured CatalogIndex (defaults to the published one)
+        """
+        index = self._current(index)
+        if not cf_scores or cf_weight <= 0:
+            return self.recommend_from_profile(user_vector, top_n, index)
+        if sp.issparse(user_vector):
+            user_vector = user_vector.toarray()
+        user_vector = np.asarray(user_vector, dtype=np.float64).ravel()
+        
+        # Candidates: content top-k ∪ collaborative candidates in the live catalog
+        content = self.recommend_from_profile(user_vector, content_candidates or 4 * top_n, index)
+        rows = {rec['product_index'] for rec in content}
+        rows.update(index.row_of[pid] for pid in cf_scores if pid in index.row_of)
+        rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+        rows = rows[index.product_active[rows]]
+        
+        content_scores = index.product_matrix[rows] @ user_vector
+        cf = np.array([cf_scores.get(int(pid), 0.0) for pid in index.product_ids[rows]])
+        if cf.max(initial=0.0) > 0:
+            cf = cf / cf.max()
+        blended = (1 - cf_weight) * content_scores + cf_weight * cf
+        
+        best, best_scores = top_k(blended, top_n, threshold=MIN_RELEVANCE)
+        return self._format_recommendations(index, rows[best], best_scores)
+    
+    @staticmethod
+    def _query_vector(index, query):
+        """Search query → L2-normalized TF-IDF row, LRU-cached by normalized text"""
+        key = " ".join(query.lower().split())
+        vector = index.query_vectors.get(key)
+        if vector is None:
+            vector = normalize(index.vectorizer.transform([key]), norm='l2').tocsr()
+            index.query_vectors.put(key, vector)
+        return vector
+    
+    def search(self, query, top_n=10, filters=None, index=None):
+        """
+        🔎 Free-text search scored against the cached product matrix
+        
+        Args:
+            query: Search text (vectorized once, then served from the LRU)
+            top_n: Max results
+            filters: Optional dict with
+                'product_ids': only these products are eligible
+                'exclude_ids': products to leave out
+                'min_score': minimum cosine score (defaults to MIN_RELEVANCE)
+            index: Captured CatalogIndex (defaults to the published one)
+        
+        Returns:
+            Result dicts like recommend_from_profile(), best first
+        """
+        index = self._current(index)
+        filters = filters or {}
+        query_vector = self._query_vector(index, query)
+        if query_vector.nnz == 0:  # No known terms
+            return []
+        
+        if filters.get('product_ids') is not None:
+            rows = np.array([index.row_of[pid] for pid in map(int, filters['product_ids'])
+                             if pid in index.row_of], dtype=np.int64)
+            scores = np.asarray((index.product_matrix[rows] @ query_vector.T).todense()).ravel()
+        else:
+            # Sparse x sparse: only products sharing a term with the query get a score
+            hits = (index.product_matrix @ query_vector.T).tocoo()
+            rows, scores = hits.row.astype(np.int64), hits.data
+        
+        keep = index.product_active[rows]
+        if filters.get('exclude_ids'):
+            excluded = [index.row_of[pid] for pid in map(int, filters['exclude_ids']) if pid in index.row_of]
+            keep &= ~np.isin(rows, excluded)
+        rows, scores = rows[keep], scores[keep]
+        
+        best, best_scores = top_k(scores, top_n, threshold=filters.get('min_score', MIN_RELEVANCE))
+        return self._format_recommendations(index, rows[best], best_scores)
+    
+    def get_recommendations(self, user_behaviors, product_contexts=None, top_n=5,
+                            product_ids=None, catalog_version=None):
         """
         COMPLETE RECOMMENDATION PIPELINE
         
         Args:
             user_behaviors: List of user behavior dicts
-            product_contexts: List of ALL active product contexts
+            product_contexts: List of ALL active product contexts (optional
+                when the cached product matrix is kept up to date through
+                fit()/update_products())
             top_n: Number of recommendations
+            product_ids: Product id for each context (optional)
+            catalog_version: Catalog version token; the cached product matrix
+                is only rebuilt when this changes
             
         Returns:
-            List of (product_index, similarity_score, product_context)
+            List of (product_index, product_id, similarity_score, match_percentage)
         """
         if not self.is_fitted:
             raise ValueError("Must call fit() first with product contexts!")
         
+        if product_contexts is not None:
+            self.ensure_product_matrix(product_contexts, product_ids, catalog_version)
+        index = self._current()
+        
         if not user_behaviors:
             print("⚠️  No user behaviors - returning empty recommendations")
             return []
         
-        # Step 1: Build user interest profile
-        interest_text = self.build_interest_profile(user_behaviors)
-        if not interest_text:
+        # Step 1+2: Build user interest vector
+        user_vector = self.build_interest_profile(user_behaviors, index=index)
+        if user_vector is None:
             return []
         
-        # Step 2: Vectorize user interest
-        user_vector = self.vectorizer.transform([interest_text])
+        # Step 3+4: Score + top N
+        return self.recommend_from_profile(user_vector, top_n, index)
+    
+    def get_recommendations_batch(self, behaviors_by_user, top_n=5, memory_budget=BATCH_MEMORY_BUDGET,
+                                  index=None):
+        """
+        Recommendations for many users with one sparse matrix multiply per chunk
         
-        # Step 3: Vectorize all products
-        product_vectors = self.vectorizer.transform(product_contexts)
+        Args:
+            behaviors_by_user: Dict of user_id -> list of user behavior dicts
+            top_n: Number of recommendations per user
+            memory_budget: Max bytes for the dense (users x products) score
+                block; users are processed in chunks that fit in it
+            index: Captured CatalogIndex (defaults to the published one)
         
-        # Step 4: Calculate cosine similarities
-        similarities = cosine_similarity(user_vector, product_vectors)[0]
+        Returns:
+            Dict of user_id -> list of recommendation dicts (same format as
+            get_recommendations); users without a usable profile map to []
+        """
+        index = self._current(index)
+        results = {user_id: [] for user_id in behaviors_by_user}
+        chunk_size = self.batch_chunk_size(memory_budget, index)
         
-        # Step 5: Get top N recommendations
-        top_indices = np.argsort(-similarities)[:top_n]
+        # Step 1: Stack every user's profile vector into one sparse matrix
+        user_ids, profiles = [], []
+        for user_id, behaviors in behaviors_by_user.items():
+            profile = self.build_interest_profile(behaviors, index=index)
+            if profile is not None:
+                user_ids.append(user_id)
+                profiles.append(profile)
+        if not user_ids:
+            return results
+        user_matrix = sp.vstack(profiles, format='csr')
         
-        recommendations = []
-        for idx in top_indices:
-            score = similarities[idx]
-            if score > 0.1:  # Minimum relevance threshold
-                recommendations.append({
-                    'product_index': int(idx),
-                    'similarity_score': float(score),
-                    'match_percentage': round(float(score) * 100, 1),
-                    'product_context': product_contexts[idx]
-                })
+        # Step 2: Score chunk by chunk against the cached product matrix
+        product_matrix_t = index.product_matrix.T.tocsc()
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_matrix[start:start + chunk_size]
+            scores = (chunk @ product_matrix_t).toarray()
+            scores[:, ~index.product_active] = 0.0
+            
+            # Step 3: Per-user top N with the shared batched kernel
+            top_indices, top_scores = top_k_batch(scores, top_n, threshold=MIN_RELEVANCE)
+            for row, user_id in enumerate(user_ids[start:start + chunk_size]):
+                keep = top_indices[row] >= 0
+                results[user_id] = self._format_recommendations(
+                    index, top_indices[row][keep], top_scores[row][keep]
+                )
         
-        print(f"🎯 Found {len(recommendations)} recommendations (max {top_n})")
-        return recommendations
+        print(f"🎯 Batch scored {len(user_ids)} users in chunks of {chunk_size}")
+        return results
+    
+    def batch_chunk_size(self, memory_budget=BATCH_MEMORY_BUDGET, index=None):
+        """Users whose dense score rows fit in `memory_budget` bytes at once"""
+        return max(1, memory_budget // (self._current(index).product_matrix.shape[0] * 8))
+    
+    @staticmethod
+    def _format_recommendations(index, indices, scores):
+        """Turn matrix row indices + scores into recommendation dicts"""
+        return [
+            {
+                'product_index': int(idx),
+                'product_id': int(index.product_ids[idx]),
+                'similarity_score': float(score),
+                'match_percentage': round(float(score) * 100, 1)
+            }
+            for idx, score in zip(indices, scores)
+        ]
+    
+    def explain_recommendation(self, user_behaviors, product_context, top_words=5,
+                               user_vector=None, product_id=None, index=None):
+        """
+        Explain WHY this product was recommended
+        
+        Pass user_vector to skip the profile build and product_id to reuse the
+        cached product row instead of re-vectorizing product_context.
+        """
+        index = self._current(index)
+        if user_vector is None:
+            user_vector = self.build_interest_profile(user_behaviors, index=index)
+        if user_vector is None:
+            return "Matches on: "
+        
+        row = index.row_of.get(product_id)
+        product_vector = (index.product_matrix[row] if row is not None
+                          else self._text_vector(index, product_context))
+        return self._explain_rows(index, user_vector, product_vector, top_words)[0]
     
-    def explain_recommendation(self, user_behaviors, product_context, top_words=5):
-        """Explain WHY this product was recommended"""
-        interest_text = self.build_interest_profile(user_behaviors)
-        user_vector = self.vectorizer.transform([interest_text])
-        product_vector = self.vectorizer.transform([product_context])
+    def explain_recommendations(self, user_vector, product_ids, top_words=5, index=None):
+        """
+        Explain several recommended products for one profile in a single pass
+        
+        Args:
+            user_vector: The profile the products were scored with (dense or 1 x V sparse)
+            product_ids: Recommended product ids (must be in the cached matrix)
+            top_words: Max matching terms per explanation
+            index: The CatalogIndex the products were scored with
         
-        # Get top matching words
-        feature_names = self.vocabulary
-        user_scores = user_vector.toarray()[0]
-        product_scores = product_vector.toarray()[0]
+        Returns:
+            List of explanation strings, one per product id
+        """
+        index = self._current(index)
+        rows = [index.row_of[int(pid)] for pid in product_ids]
+        return self._explain_rows(index, user_vector, index.product_matrix[rows], top_words)
+    
+    @staticmethod
+    def _explain_rows(index, user_vector, product_rows, top_words):
+        """
+        Top shared terms between a profile and each CSR product row
         
-        matches = []
-        for i, (user_score, prod_score) in enumerate(zip(user_scores, product_scores)):
-            if user_score > 0.1 and prod_score > 0.1:
-                matches.append((feature_names[i], user_score, prod_score))
+        Only the product rows' nonzero terms are visited (sparse index
+        intersection) - nothing is densified to vocabulary size per product.
+        """
+        if sp.issparse(user_vector):
+            user_vector = user_vector.toarray()
+        user_scores = np.asarray(user_vector, dtype=np.float64).ravel()
+        product_rows = product_rows.sorted_indices()  # Ties resolve in vocabulary order
         
-        matches.sort(key=lambda x: x[1] * x[2], reverse=True)
-        top_matches = matches[:top_words]
+        # Score every stored (row, term) entry at once
+        term_user_scores = user_scores[product_rows.indices]
+        contributions = term_user_scores * product_rows.data
+        matches = (term_user_scores > 0.1) & (product_rows.data > 0.1)
         
-        explanation = f"Matches on: {', '.join([m[0] for m in top_matches])}"
-        return explanation
+        explanations = []
+        for start, end in zip(product_rows.indptr[:-1], product_rows.indptr[1:]):
+            matched = np.flatnonzero(matches[start:end]) + start
+            best = matched[np.argsort(-contributions[matched], kind='stable')[:top_words]]
+            terms = index.vocabulary[product_rows.indices[best]]
+            explanations.append(f"Matches on: {', '.join(terms)}")
+        return explanations
 
 # 🧪 TEST FUNCTION (Run this file directly to test!)
 if __name__ == "__main__":
@@ -162,8 +1009,8 @@ if __name__ == "__main__":
     user_behaviors = [
         {'action': 'search', 'searchquery': 'wireless headphones'},
         {'action': 'search', 'searchquery': 'gym headphones'},
-        {'action': 'click', 'productcontext': products[0]},
-        {'action': 'view', 'productcontext': products[3]}
+        {'action': 'click', 'productid': 0, 'productcontext': products[0]},
+        {'action': 'view', 'productid': 3, 'productcontext': products[3]}
     ]
     
     # Create and test engine
@@ -177,5 +1024,5 @@ if __name__ == "__main__":
     for i, rec in enumerate(recs, 1):
         print(f"{i}. Product #{rec['product_index']}")
         print(f"   Score: {rec['match_percentage']}%")
-        print(f"   Context: {rec['product_context'][:60]}...")
+        print(f"   Context: {products[rec['product_id']][:60]}...")
         print()
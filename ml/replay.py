@@ -0,0 +1,40 @@
+"""
+Live Events During a Background Rebuild
+- Models rebuilt from history in a background thread keep receiving live
+  events; from begin_build() until the build swaps its state in they are
+  also recorded, and the build replays them onto the fresh state
+- Before the first build has finished they are only recorded (there is no
+  state to apply them to yet)
+"""
+
+class BuildReplay:
+    """
+    Mixin for incrementally updated models. The model provides `_lock`
+    (an RLock), `is_built`, and a `_pending` attribute its _reset() sets to None.
+    """
+
+    def begin_build(self):
+        """Start buffering live events so a build can replay them when it swaps in"""
+        with self._lock:
+            self._pending = []
+
+    def end_build(self):
+        with self._lock:
+            self._pending = None
+
+    def _defer(self, event):
+        """
+        Record a live event for the running build (caller holds _lock)
+
+        Returns:
+            True if the event must not be applied yet (no built state)
+        """
+        if self._pending is None:
+            return False
+        self._pending.append(event)
+        return not self.is_built
+
+    def _take_pending(self):
+        """Events recorded since begin_build(), to replay after the swap (caller holds _lock)"""
+        pending, self._pending = self._pending or [], None
+        return pending
@@ -0,0 +1,147 @@
+"""
+Session Next-Item Model
+- Sessionization: a user's views/clicks belong to one session while the gap
+  between consecutive events stays under session_gap
+- First-order transitions: product -> next (different) product in the same
+  session, counted in per-product successor Counters
+- Streaming: each ingested event adds at most one transition; successor
+  lists are pruned to the top max_successors
+- "Next up" = decayed sum of P(next | item) over the last few session
+  items - pure in-memory, no DB on the request path (open sessions are
+  per worker: each one sees the events it ingested)
+"""
+
+from collections import Counter, OrderedDict
+from datetime import datetime
+import threading
+
+try:
+    from ml.recommender import to_epoch_seconds
+    from ml.replay import BuildReplay
+except ImportError:  # Running this file directly (python ml/session.py)
+    from recommender import to_epoch_seconds
+    from replay import BuildReplay
+
+DEFAULT_SESSION_ACTIONS = ('view', 'click')
+SESSION_GAP = 30 * 60  # Seconds of inactivity that end a session
+
+class SessionTransitionModel(BuildReplay):
+    def __init__(self, max_successors=50, session_gap=SESSION_GAP, history=3, decay=0.5,
+                 max_users=100000, actions=DEFAULT_SESSION_ACTIONS):
+        """
+        Args:
+            max_successors: Next products kept per product
+            session_gap: Seconds of inactivity that end a session
+            history: Recent session items remembered per user (and used to score)
+            decay: Weight multiplier per step back in the session
+            max_users: Users whose open sessions are kept in memory (LRU)
+            actions: Behavior actions that count as session steps
+        """
+        self.max_successors = max_successors
+        self.session_gap = session_gap
+        self.history = history
+        self.decay = decay
+        self.max_users = max_users
+        self.actions = set(actions)
+        self.is_built = False
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._successors = {}          # product id -> Counter(next product id -> count)
+        self._totals = Counter()       # product id -> transitions out (before pruning)
+        self._sessions = OrderedDict() # user id -> (last event seconds, [recent product ids])
+        self._pending = None           # Events seen while a build runs
+
+    def build(self, events):
+        """
+        Full build from behavior history
+
+        Args:
+            events: Iterable of (user_id, product_id, action, timestamp),
+                ordered by user then time
+        """
+        fresh = SessionTransitionModel(self.max_successors, self.session_gap, self.history,
+                                       self.decay, self.max_users, self.actions)
+        for user_id, product_id, action, timestamp in events:
+            fresh._add(user_id, product_id, action, timestamp)
+
+        with self._lock:
+            pending = self._take_pending()
+            self._reset()
+            self._successors = fresh._successors
+            self._totals = fresh._totals
+            self._sessions = fresh._sessions
+            self.is_built = True
+            for event in pending:
+                self._add(*event)
+        print(f"🔁 Built session transitions: {len(self._successors)} products, "
+              f"{sum(len(c) for c in self._successors.values())} transitions kept")
+
+    def add_event(self, user_id, product_id, action, timestamp=None):
+        """Apply one just-ingested behavior (timestamp defaults to now, UTC like the DB)"""
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        with self._lock:
+            if self._defer((user_id, product_id, action, timestamp)):
+                return
+            self._add(user_id, product_id, action, timestamp)
+
+    def _add(self, user_id, product_id, action, timestamp):
+        if product_id is None or action not in self.actions or timestamp is None:
+            return
+        user_id, product_id, when = str(user_id), int(product_id), to_epoch_seconds(timestamp)
+        session = self._sessions.get(user_id)
+        if session is None or when - session[0] > self.session_gap:
+            recent = []  # New session: no transition into its first item
+        else:
+            recent = session[1]
+            if recent and recent[-1] != product_id:
+                self._count(recent[-1], product_id)
+        if not recent or recent[-1] != product_id:
+            recent = (recent + [product_id])[-self.history:]
+        self._sessions[user_id] = (max(when, session[0]) if session else when, recent)
+        self._sessions.move_to_end(user_id)
+        if len(self._sessions) > self.max_users:
+            self._sessions.popitem(last=False)
+
+    def _count(self, product_id, next_id):
+        successors = self._successors.setdefault(product_id, Counter())
+        successors[next_id] += 1
+        self._totals[product_id] += 1
+        if len(successors) > 2 * self.max_successors:
+            self._successors[product_id] = Counter(dict(successors.most_common(self.max_successors)))
+
+    def session_items(self, user_id, now=None):
+        """The user's recent items in their still-open session, oldest first"""
+        now = to_epoch_seconds(now)
+        with self._lock:
+            session = self._sessions.get(str(user_id))
+            if session is None or now - session[0] > self.session_gap:
+                return []
+            return list(session[1])
+
+    def next_up(self, recent_items, top_n=5):
+        """
+        Likely next products after a sequence of items
+
+        Args:
+            recent_items: Product ids, oldest first (the last one weighs most)
+            top_n: Results wanted
+
+        Returns:
+            List of (product_id, score), best first; the recent items excluded
+        """
+        recent_items = [int(pid) for pid in recent_items][-self.history:]
+        scores = Counter()
+        with self._lock:
+            weight = 1.0
+            for product_id in reversed(recent_items):
+                total = self._totals.get(product_id)
+                if total:
+                    for next_id, count in self._successors[product_id].items():
+                        scores[next_id] += weight * count / total
+                weight *= self.decay
+        for product_id in recent_items:
+            scores.pop(product_id, None)
+        return [(pid, float(score)) for pid, score in scores.most_common(top_n)]
@@ -0,0 +1,205 @@
+"""
+Search Suggestion (Autocomplete) Index
+- In-memory prefix index over product names and popular past search queries
+- Sorted key array + bisect: a prefix is one contiguous key range
+- Product names are indexed from every word ("bass pro headphones",
+  "pro headphones", "headphones"), so typing any word start matches
+- Ranked by popularity (interactions for products, counts for queries);
+  results for 1-2 character prefixes are memoized since their ranges are large
+- Incremental: add/remove single products and count new queries in place
+"""
+
+from bisect import bisect_left
+import heapq
+import re
+import threading
+
+HEAD_PREFIX_LEN = 2      # Prefixes this short get their results memoized
+MIN_QUERY_COUNT = 2      # A past search must be this popular to be suggested
+MAX_TRACKED_QUERIES = 100000
+
+def normalize_text(text):
+    """Lowercase, words only, single-spaced"""
+    return " ".join(re.findall(r"\w+", (text or "").lower()))
+
+class SuggestIndex:
+    def __init__(self, min_query_count=MIN_QUERY_COUNT, max_tracked_queries=MAX_TRACKED_QUERIES):
+        """
+        Args:
+            min_query_count: Searches needed before a query is suggested
+            max_tracked_queries: Bound on distinct queries counted in memory
+        """
+        self.min_query_count = min_query_count
+        self.max_tracked_queries = max_tracked_queries
+        self.catalog_version = None
+        self._keys = []        # Sorted index keys
+        self._entry_of = []    # Entry id for each key (parallel to _keys)
+        self._entries = {}     # entry id -> {'text', 'kind', 'score', 'keys'}
+        self._query_counts = {}
+        self._heads = {}       # Memoized results for short prefixes
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _word_keys(text):
+        words = normalize_text(text).split()
+        return [" ".join(words[i:]) for i in range(len(words))]
+
+    def _insert(self, entry_id, text, kind, score, keys):
+        self._entries[entry_id] = {'text': text, 'kind': kind, 'score': score, 'keys': keys}
+        for key in keys:
+            position = bisect_left(self._keys, key)
+            self._keys.insert(position, key)
+            self._entry_of.insert(position, entry_id)
+        self._invalidate(keys)
+
+    def _delete(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in entry['keys']:
+            position = bisect_left(self._keys, key)
+            while self._entry_of[position] != entry_id:  # Same key, other entries
+                position += 1
+            del self._keys[position]
+            del self._entry_of[position]
+        self._invalidate(entry['keys'])
+
+    def _invalidate(self, keys):
+        for key in keys:
+            for length in range(1, HEAD_PREFIX_LEN + 1):
+                self._heads.pop(key[:length], None)
+
+    def build(self, products, queries, catalog_version=None):
+        """
+        Full (re)build
+
+        Args:
+            products: Iterable of (product_id, name, popularity)
+            queries: Iterable of (query text, count)
+            catalog_version: Catalog version the products reflect
+        """
+        pairs, entries = [], {}
+        for product_id, name, popularity in products:
+            keys = self._word_keys(name)
+            entries[('product', int(product_id))] = {
+                'text': name, 'kind': 'product', 'score': float(popularity), 'keys': keys
+            }
+            pairs.extend((key, ('product', int(product_id))) for key in keys)
+        query_counts = {}
+        for text, count in queries:
+            key = normalize_text(text)
+            if key:
+                query_counts[key] = query_counts.get(key, 0) + int(count)
+        for key, count in query_counts.items():
+            if count >= self.min_query_count:
+                entries[('query', key)] = {'text': key, 'kind': 'query', 'score': float(count), 'keys': [key]}
+                pairs.append((key, ('query', key)))
+        pairs.sort(key=lambda pair: pair[0])  # One sort instead of n inserts
+
+        with self._lock:
+            self._keys = [key for key, _ in pairs]
+            self._entry_of = [entry_id for _, entry_id in pairs]
+            self._entries = entries
+            self._query_counts = query_counts
+            self._heads = {}
+            self.catalog_version = catalog_version
+        print(f"🔤 Built suggestion index: {len(entries)} entries, {len(pairs)} keys")
+
+    def add_product(self, product_id, name, popularity=None):
+        """Index a new product, or re-index a changed one (popularity None keeps the old score)"""
+        entry_id = ('product', int(product_id))
+        with self._lock:
+            if popularity is None:
+                popularity = self._entries.get(entry_id, {}).get('score', 0.0)
+            self._delete(entry_id)
+            self._insert(entry_id, name, 'product', float(popularity), self._word_keys(name))
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._delete(('product', int(product_id)))
+
+    def add_query(self, text, count=1):
+        """Count a search; it becomes a suggestion once it reaches min_query_count"""
+        key = normalize_text(text)
+        if not key:
+            return
+        with self._lock:
+            total = self._query_counts.get(key, 0) + count
+            if key not in self._query_counts and len(self._query_counts) >= self.max_tracked_queries:
+                return  # Full: keep the counts we have rather than thrash
+            self._query_counts[key] = total
+            entry_id = ('query', key)
+            if total < self.min_query_count:
+                return
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                self._insert(entry_id, key, 'query', float(total), [key])
+            else:
+                entry['score'] = float(total)
+                self._invalidate(entry['keys'])
+
+    def set_catalog_version(self, catalog_version):
+        with self._lock:
+            self.catalog_version = catalog_version
+
+    def suggest(self, prefix, limit=8):
+        """
+        Most popular suggestions whose text (or any word onward) starts with `prefix`
+
+        Returns:
+            List of {'text', 'kind', 'product_id'} dicts (product_id None for queries)
+        """
+        key = normalize_text(prefix)
+        if not key or limit <= 0:
+            return []
+        if prefix[-1:].isspace():
+            key += " "  # "bass " should not match "bassoon"
+        with self._lock:
+            if len(key) <= HEAD_PREFIX_LEN:
+                cached = self._heads.get(key)
+                if cached is not None and len(cached) >= limit:
+                    return cached[:limit]
+            start = bisect_left(self._keys, key)
+            end = bisect_left(self._keys, key + "\uffff")
+            entry_ids = set(self._entry_of[start:end])
+            best = heapq.nsmallest(
+                limit, entry_ids,
+                key=lambda e: (-self._entries[e]['score'], self._entries[e]['text'])
+            )
+            results = [
+                {
+                    'text': self._entries[e]['text'],
+                    'kind': self._entries[e]['kind'],
+                    'product_id': e[1] if e[0] == 'product' else None
+                }
+                for e in best
+            ]
+            if len(key) <= HEAD_PREFIX_LEN:
+                self._heads[key] = results
+            return results
+
+    def __len__(self):
+        return len(self._entries)
+
+# 🧪 LATENCY CHECK (Run this file directly!)
+if __name__ == "__main__":
+    import random
+    import time
+    rng = random.Random(0)
+    words = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(3, 9))) for _ in range(20000)]
+    index = SuggestIndex()
+    started = time.perf_counter()
+    index.build(
+        ((i, " ".join(rng.choices(words, k=3)), rng.random() * 100) for i in range(200000)),
+        ((" ".join(rng.choices(words, k=2)), rng.randint(1, 50)) for _ in range(50000))
+    )
+    print(f"Build: {time.perf_counter() - started:.1f}s")
+
+    prefixes = [w[:n] for w in rng.sample(words, 1000) for n in (1, 2, 3, 5)]
+    for prefix in prefixes:
+        index.suggest(prefix)  # Warm pass memoizes the 1-2 character heads
+    started = time.perf_counter()
+    for prefix in prefixes:
+        index.suggest(prefix)
+    elapsed = (time.perf_counter() - started) / len(prefixes) * 1000
+    print(f"suggest(): {elapsed:.3f} ms/query over {len(prefixes)} prefixes (1-5 chars)")
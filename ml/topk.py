@@ -0,0 +1,72 @@
+"""
+Fast Top-K Selection
+- argpartition (O(n)) instead of a full argsort (O(n log n))
+- Relevance threshold applied as a vectorized mask
+- Batched form for (users x products) score matrices, shared by the
+  online and batch recommendation paths
+"""
+
+import numpy as np
+
+def top_k(scores, k, threshold=None):
+    """
+    Top-k entries of a 1-D score vector, best first
+
+    Args:
+        scores: 1-D array of scores
+        k: Number of results wanted
+        threshold: Drop scores <= threshold (None keeps everything)
+
+    Returns:
+        (indices, scores) arrays of length <= k
+    """
+    scores = np.asarray(scores).ravel()
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=scores.dtype)
+
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+    top_scores = scores[candidates]
+
+    if threshold is not None:
+        keep = top_scores > threshold
+        candidates, top_scores = candidates[keep], top_scores[keep]
+    return candidates, top_scores
+
+def top_k_batch(score_matrix, k, threshold=None):
+    """
+    Per-row top-k of a dense (users x products) score matrix, best first
+
+    Args:
+        score_matrix: 2-D array, one row per user
+        k: Number of results wanted per row
+        threshold: Scores <= threshold are reported as index -1
+
+    Returns:
+        (indices, scores) arrays of shape (n_rows, min(k, n_cols)); rows
+        with fewer than k passing scores are padded with index -1
+    """
+    score_matrix = np.asarray(score_matrix)
+    n_rows, n_cols = score_matrix.shape
+    k = min(k, n_cols)
+    if k <= 0:
+        return (np.empty((n_rows, 0), dtype=np.int64),
+                np.empty((n_rows, 0), dtype=score_matrix.dtype))
+
+    if k < n_cols:
+        candidates = np.argpartition(-score_matrix, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    candidate_scores = np.take_along_axis(score_matrix, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    indices = np.take_along_axis(candidates, order, axis=1).astype(np.int64)
+    scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+    if threshold is not None:
+        indices[scores <= threshold] = -1
+    return indices, scores
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, DateTime, ForeignKey, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -14,6 +14,11 @@ class Product(Base):
     productcontext = Column(Text, nullable=False)  # CRITICAL for AI!
     stock = Column(Integer, default=0)
     isactive = Column(Boolean, default=True)
+    
+    __table_args__ = (
+        # Partial index: only the active, in-stock catalog (see migrations.py)
+        Index("ix_products_active_in_stock", "id", sqlite_where=text("isactive = 1 AND stock > 0")),
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -30,3 +35,18 @@ class UserBehavior(Base):
     action = Column(String(50), nullable=False)  # 'view', 'click', 'search'
     searchquery = Column(String(255), nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_user_behaviors_userid_timestamp", "userid", "timestamp"),
+        Index("ix_user_behaviors_productid_action", "productid", "action"),
+    )
+
+class CatalogChange(Base):
+    __tablename__ = "catalog_changes"
+    
+    # Appended by triggers on products (see migrations.py) - the max version
+    # is the catalog version every worker compares its indexes against
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, nullable=False)
+    
+    __table_args__ = {"sqlite_autoincrement": True}  # Versions are never reused
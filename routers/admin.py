@@ -1,22 +1,23 @@
 from fastapi import APIRouter, Depends, Form, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from crud import create_product, get_products
+from database import get_db, get_async_db
+from crud import create_product, get_products_page_async, toggle_product as toggle_product_state
 from schemas import ProductCreate
-from models import Product
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
 @router.get("/", response_class=HTMLResponse)
-async def admin_dashboard(request: Request, db: Session = Depends(get_db)):
+async def admin_dashboard(request: Request, after: int = 0, db: AsyncSession = Depends(get_async_db)):
     """Admin dashboard - list all products"""
-    products = get_products(db)
+    products, next_after = await get_products_page_async(db, after_id=after)  # Keyset page
     return templates.TemplateResponse("admin/dashboard.html", {
         "request": request, 
-        "products": products
+        "products": products,
+        "next_after": next_after
     })
 
 @router.get("/add", response_class=HTMLResponse)
@@ -25,7 +26,7 @@ async def add_product_form(request: Request):
     return templates.TemplateResponse("admin/add_product.html", {"request": request})
 
 @router.post("/add")
-async def create_new_product(
+def create_new_product(
     name: str = Form(...),
     price: float = Form(...),
     description: str = Form(""),
@@ -34,7 +35,7 @@ async def create_new_product(
     isactive: bool = Form(False),
     db: Session = Depends(get_db)
 ):
-    """Handle product creation"""
+    """Handle product creation (sync writer → runs in the threadpool, off the event loop)"""
     product_data = ProductCreate(
         name=name,
         price=price,
@@ -47,10 +48,7 @@ async def create_new_product(
     return RedirectResponse(url="/admin/", status_code=303)
 
 @router.get("/toggle/{product_id}")
-async def toggle_product(product_id: int, db: Session = Depends(get_db)):
+def toggle_product(product_id: int, db: Session = Depends(get_db)):
     """Toggle product active/inactive"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if product:
-        product.isactive = not product.isactive
-        db.commit()
+    toggle_product_state(db, product_id)
     return RedirectResponse(url="/admin/", status_code=303)
@@ -0,0 +1,151 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, ReadSessionLocal
+from crud import iter_training_behaviors, get_max_behavior_id, get_products_by_ids_async
+from ingest import behavior_buffer
+from ml.als import ALS_FORMAT, ALSEngine, build_preference_matrix
+from ml.snapshots import read_manifest, single_writer
+from schemas import FactorizedRecommendation
+from typing import List
+import os
+import threading
+import time
+
+router = APIRouter(prefix="/recommendations/factorized", tags=["recommendations"])
+
+# Implicit ALS factors, trained offline-style in a background thread by one
+# worker at a time; every worker memory-maps the saved ones. Saved factors
+# are retrained once new behaviors exist and they are older than the interval.
+# Each worker re-checks them every ALS_CHECK_INTERVAL seconds.
+ALS_PATH = os.environ.get("RECOMMENDER_ALS", "snapshots/als")
+ALS_FACTORS = int(os.environ.get("RECOMMENDER_ALS_FACTORS", 64))
+ALS_RETRAIN_INTERVAL = float(os.environ.get("RECOMMENDER_ALS_RETRAIN_INTERVAL", 3600))
+ALS_CHECK_INTERVAL = float(os.environ.get("RECOMMENDER_ALS_CHECK_INTERVAL", 60))
+als_engine = None
+_als_trained_at = None  # trained_at of the saved factors als_engine maps
+_train_thread = None
+_check_thread = None
+_schedule_lock = threading.Lock()
+
+def _saved_factors():
+    """Manifest of the factors on disk (None if there are no loadable ones)"""
+    manifest = read_manifest(ALS_PATH)
+    if manifest is None or manifest.get('format') != ALS_FORMAT:
+        return None
+    return manifest
+
+def als_factors_are_stale(manifest, behavior_high_water):
+    """Saved factors need retraining: none yet, or newer behaviors and older than the interval"""
+    if manifest is None:
+        return True
+    return (behavior_high_water > manifest.get('behavior_high_water', 0)
+            and time.time() - manifest['trained_at'] >= ALS_RETRAIN_INTERVAL)
+
+def _map_saved_factors(manifest):
+    """Swap in the saved factors (memory-mapped) unless they are already the ones mapped"""
+    global als_engine, _als_trained_at
+    if als_engine is None or _als_trained_at != manifest['trained_at']:
+        als_engine = ALSEngine.load(ALS_PATH)
+        _als_trained_at = manifest['trained_at']
+
+def train_als_engine():
+    """
+    Background job: retrain the saved factors if they are stale, then map them
+    
+    One worker at a time holds the factors' writer lock, so only one of them
+    trains; the others wait for it and map what it saved.
+    """
+    db = ReadSessionLocal()
+    try:
+        with single_writer(ALS_PATH):
+            manifest = _saved_factors()
+            behavior_buffer.flush()
+            behavior_high_water = get_max_behavior_id(db)
+            if als_factors_are_stale(manifest, behavior_high_water):
+                matrix, user_ids, item_ids = build_preference_matrix(iter_training_behaviors(db))
+                if matrix.nnz == 0:
+                    return
+                engine = ALSEngine(factors=ALS_FACTORS)
+                engine.fit(matrix, user_ids, item_ids)
+                engine.save(ALS_PATH, {'behavior_high_water': behavior_high_water})
+                manifest = _saved_factors()
+            _map_saved_factors(manifest)
+    except Exception as e:
+        print(f"❌ ALS training failed: {e}")
+    finally:
+        db.close()
+
+def schedule_als_training():
+    """Start the background training unless one is already running"""
+    global _train_thread
+    with _schedule_lock:
+        if _train_thread is not None and _train_thread.is_alive():
+            return
+        _train_thread = threading.Thread(target=train_als_engine, name="als-train", daemon=True)
+        _train_thread.start()
+
+def check_als_engine():
+    """
+    Map factors another worker saved since; once the saved ones are older
+    than the retrain interval (or missing), run the training job - it
+    retrains only if new behaviors exist, in one worker at a time
+    """
+    manifest = _saved_factors()
+    if manifest is not None and time.time() - manifest['trained_at'] < ALS_RETRAIN_INTERVAL:
+        _map_saved_factors(manifest)
+    else:
+        schedule_als_training()
+
+def _als_checker():
+    while True:
+        time.sleep(ALS_CHECK_INTERVAL)
+        try:
+            check_als_engine()
+        except Exception as e:
+            print(f"❌ ALS check failed: {e}")
+
+def warm_start_als_engine():
+    """
+    Worker boot: map the last saved factors, retrain them in the background
+    if stale, and keep checking them periodically
+    """
+    global _check_thread
+    manifest = _saved_factors()
+    if manifest is not None:
+        _map_saved_factors(manifest)
+    schedule_als_training()
+    with _schedule_lock:
+        if _check_thread is None:
+            _check_thread = threading.Thread(target=_als_checker, name="als-check", daemon=True)
+            _check_thread.start()
+
+@router.get("/", response_model=List[FactorizedRecommendation])
+async def get_factorized_recommendations(
+    user_id: str = "demo_user_1",
+    top_n: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    🧮 MATRIX FACTORIZATION RECOMMENDATIONS
+    One dot product against the item factors + top-k - cost does not grow with
+    the user's history. Users unseen at training time get an empty list.
+    """
+    if als_engine is None:
+        schedule_als_training()
+        raise HTTPException(status_code=503, detail="Factorization model is still training")
+    # Over-fetch so inactive / out-of-stock products can be dropped
+    scored = als_engine.recommend(user_id, top_n=top_n * 2)
+    products_by_id = {
+        p.id: p for p in await get_products_by_ids_async(db, [r['product_id'] for r in scored])
+    }
+    return [
+        {
+            'product_id': r['product_id'],
+            'name': products_by_id[r['product_id']].name,
+            'price': float(products_by_id[r['product_id']].price),
+            'score': r['score']
+        }
+        for r in scored
+        if r['product_id'] in products_by_id
+        and products_by_id[r['product_id']].isactive and products_by_id[r['product_id']].stock > 0
+    ][:top_n]
@@ -1,91 +1,523 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from crud import get_user_behaviors, get_products
-from ml.recommender import RecommenderEngine
-from schemas import Recommendation
-from models import Product, UserBehavior
-from typing import List
-import uuid
+from database import get_read_db, get_async_db, ReadSessionLocal, query_budget
+from crud import (get_products_by_ids, user_id_key,
+                  iter_active_catalog, has_active_products, get_behaviors_with_context_for_users,
+                  iter_item_interactions, iter_training_behaviors, get_max_behavior_id,
+                  get_products_by_ids_async, get_user_behaviors_with_context_async,
+                  count_user_behaviors_async,
+                  get_newest_products_async, get_products_page_async)
+from catalog import catalog_tracker
+from ingest import behavior_buffer
+from scoring import (ScoringTimeout, RequestDeadline, scoring_executor, score_and_explain,
+                     score_from_snapshot, snapshot_token)
+from ml.recommender import SNAPSHOT_FORMAT, RecommenderEngine
+from ml.cooccurrence import CooccurrenceModel
+from ml.graph import GraphRecommender
+from ml.session import SessionTransitionModel
+from ml.snapshots import read_manifest, single_writer
+from schemas import Recommendation, BatchRecommendationRequest, UserRecommendations, NextUpItem
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import scipy.sparse as sp
+import os
+import threading
+import time
 
 router = APIRouter(prefix="/recommendations", tags=["recommendations"])
 
 # Global ML Engine (singleton pattern)
 recommendation_engine = RecommenderEngine()
 
+# Collaborative candidate source blended into the content scores
+cf_model = CooccurrenceModel()
+CF_WEIGHT = float(os.environ.get("RECOMMEND_CF_WEIGHT", 0.3))
+
+# Random-walk candidates replace co-occurrence ones for users with fewer
+# than this many remembered items (one-hop co-occurrence finds too little)
+graph_model = GraphRecommender()
+GRAPH_SPARSE_HISTORY = int(os.environ.get("RECOMMEND_GRAPH_SPARSE_HISTORY", 5))
+# The graph has no incremental update: it is rebuilt from the history every
+# interval (skipped while no behavior was stored since the last build)
+GRAPH_REBUILD_INTERVAL = float(os.environ.get("RECOMMEND_GRAPH_REBUILD_INTERVAL", 600))
+_graph_high_water = None  # Max behavior id the built graph includes
+
+# In-session "next up" transitions, kept current by record_behavior_event
+session_model = SessionTransitionModel()
+
+# Shared on-disk snapshot every worker maps: on a catalog change the first
+# worker to sync (snapshot writer lock) re-indexes and rewrites it, the
+# others re-open it - no worker keeps a private copy of the matrix
+SNAPSHOT_PATH = os.environ.get("RECOMMENDER_SNAPSHOT", "snapshots/recommender")
+
+# One catalog sync / refit at a time (they run in threadpool workers); taken
+# after the snapshot's writer lock
+engine_sync_lock = threading.Lock()
+
+# Syncs the recommend route starts run here, off the request path
+_engine_sync_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommender-sync")
+_engine_sync_guard = threading.Lock()
+_engine_sync_future = None
+
+# Snapshot the process scoring pool maps: (catalog version, fit id, token)
+_scoring_snapshot = (None, None, None)
+
+# Max SQL statements per recommend request (catalog version read, behavior
+# count, flushing buffered behaviors and loading the history on a cold
+# profile, product details). Catalog syncs run in the background sync
+# thread, outside the request and its budget.
+RECOMMEND_QUERY_BUDGET = 8
+recommend_query_budget = query_budget(RECOMMEND_QUERY_BUDGET, "GET /api/recommendations/")
+
+def to_ml_behavior(behavior, productcontext):
+    """DB UserBehavior (+ joined product context) → engine behavior dict, or None"""
+    if behavior.action == 'search':
+        return {
+            'action': 'search',
+            'searchquery': behavior.searchquery,
+            'timestamp': behavior.timestamp
+        }
+    if productcontext is None:  # view/click of a deleted product
+        return None
+    return {
+        'action': behavior.action,
+        'productid': behavior.productid,
+        'productcontext': productcontext,
+        'timestamp': behavior.timestamp
+    }
+
+def sync_recommendation_engine(db: Session):
+    """
+    Bring the engine up to date with the catalog version
+    - Shared snapshot already there (written by another worker): re-open it
+    - First call (or change log overrun / OOV drift): full fit
+    - Otherwise: re-index only the products touched since the last sync
+    Returns False if there are no active products to fit on.
+    """
+    version = catalog_tracker.refresh(db)
+    if recommendation_engine.is_fitted and recommendation_engine.catalog_version == version:
+        return True
+    if _open_snapshot_if_current(version):
+        return True
+    
+    changed_ids = catalog_tracker.changes_since(db, recommendation_engine.catalog_version, version)
+    if recommendation_engine.is_fitted and changed_ids is not None:
+        changed = get_products_by_ids(db, changed_ids)
+        added = [p for p in changed if p.isactive and p.stock > 0]
+        added_ids = {p.id for p in added}
+        removed_ids = [pid for pid in changed_ids if pid not in added_ids]
+        if recommendation_engine.update_products(
+            [p.id for p in added], [p.productcontext for p in added], removed_ids, version
+        ):
+            return True
+    
+    return refit_recommendation_engine(db, version)
+
+def recommendation_engine_is_current(version=None):
+    """Engine matches `version` (default: the catalog version last read from the DB)"""
+    version = catalog_tracker.version if version is None else version
+    return recommendation_engine.is_fitted and recommendation_engine.catalog_version == version
+
+def sync_recommendation_engine_locked():
+    """
+    sync_recommendation_engine() on its own read Session, serialized across
+    workers by the snapshot's writer lock (a worker that re-indexed rewrites
+    the snapshot before the next one looks) - for the threadpool
+    """
+    with single_writer(SNAPSHOT_PATH), engine_sync_lock:
+        db = ReadSessionLocal()
+        try:
+            synced = sync_recommendation_engine(db)
+        finally:
+            db.close()
+        if synced:
+            _write_snapshot_if_behind()
+    return synced
+
+def _sync_in_background():
+    try:
+        return sync_recommendation_engine_locked()
+    except Exception as e:
+        print(f"❌ Recommender sync failed: {e}")
+        return False
+
+def schedule_engine_sync():
+    """
+    Catch the engine up with the catalog version in the background (one sync
+    at a time per worker; requests meanwhile score the published index)
+
+    Returns:
+        Future of the running sync (result: False if there is nothing to fit)
+    """
+    global _engine_sync_future
+    with _engine_sync_guard:
+        if _engine_sync_future is None or _engine_sync_future.done():
+            _engine_sync_future = _engine_sync_pool.submit(_sync_in_background)
+        return _engine_sync_future
+
+def _mapped_snapshot(manifest):
+    global _scoring_snapshot
+    _scoring_snapshot = (manifest['catalog_version'], manifest['fit_id'], snapshot_token(SNAPSHOT_PATH))
+
+def _open_snapshot_if_current(version):
+    """
+    Re-open the shared snapshot (mmap'd) if it covers catalog `version` -
+    caller holds the snapshot's writer lock
+
+    Returns:
+        True if the engine now serves it
+    """
+    manifest = read_manifest(SNAPSHOT_PATH)
+    if manifest is None or manifest.get('format') != SNAPSHOT_FORMAT or manifest['catalog_version'] < version:
+        return False
+    recommendation_engine.load(SNAPSHOT_PATH)
+    _mapped_snapshot(manifest)
+    return True
+
+def _write_snapshot_if_behind():
+    """
+    Write the engine's current index to the shared snapshot unless the one on
+    disk (possibly written by another worker) is at least as new, then serve
+    the written snapshot mmap'd instead of this process's copy of the
+    arrays - caller holds the snapshot's writer lock
+    """
+    index = recommendation_engine.index
+    if index is None:
+        return
+    manifest = read_manifest(SNAPSHOT_PATH)
+    if manifest is None or manifest['catalog_version'] < index.catalog_version:
+        recommendation_engine.save(SNAPSHOT_PATH, index)
+        manifest = read_manifest(SNAPSHOT_PATH)
+        recommendation_engine.load(SNAPSHOT_PATH)
+    _mapped_snapshot(manifest)
+
+def scoring_task(index, user_vector, top_n, cf_scores=None, cf_weight=0.0):
+    """
+    (run, (fn, *args)): the scoring_executor method and task that score `index`
+
+    Process mode scores the shared snapshot the pool workers map - the one
+    every sync writes or re-opens (Step 4 drops products deactivated since
+    it was written). Profiles only fit the snapshot of their own vocabulary:
+    until one is written, scoring runs on this process's threads instead.
+    """
+    local = (score_and_explain, recommendation_engine, user_vector, top_n, 5, cf_scores, cf_weight,
+             index)
+    if scoring_executor.kind != "process":
+        return scoring_executor.run, local
+    _, fit_id, token = _scoring_snapshot
+    if fit_id is None or fit_id != index.fit_id:
+        return scoring_executor.run_local, local
+    return scoring_executor.run, (score_from_snapshot, SNAPSHOT_PATH, token, sp.csr_matrix(user_vector),
+                                  top_n, 5, cf_scores, cf_weight)
+
+async def degraded_recommendations(db, top_n, response):
+    """Deadline fallback: newest active products, flagged as unpersonalized"""
+    response.headers["X-Recommendations-Degraded"] = "scoring-deadline"
+    return [
+        {
+            'product_id': product.id,
+            'name': product.name,
+            'price': float(product.price),
+            'similarity_score': 0.0,
+            'match_percentage': 0.0,
+            'explanation': "New arrival (personalized scoring timed out)"
+        }
+        for product in await get_newest_products_async(db, top_n)
+    ]
+
+def refit_recommendation_engine(db: Session, version):
+    """Full fit on the ENTIRE active catalog (streamed); False if there are no active products"""
+    if not has_active_products(db):
+        return False
+    recommendation_engine.fit_from_stream(lambda: iter_active_catalog(db), version)
+    return True
+
+def warm_start_recommendation_engine():
+    """
+    Worker boot: map the shared snapshot instead of fitting
+    - Workers take the snapshot's writer lock one at a time, so on first
+      boot one of them fits and writes it while the others wait, then load
+    - Snapshot present: load it zero-copy, then re-index only the products
+      logged as changed since its version (full refit if the log no longer
+      reaches back or the vocabulary drifted)
+    - An engine that ends up ahead of the snapshot rewrites it (refits included)
+    """
+    with single_writer(SNAPSHOT_PATH), engine_sync_lock:
+        if read_manifest(SNAPSHOT_PATH) is not None:
+            try:
+                recommendation_engine.load(SNAPSHOT_PATH)
+            except (OSError, ValueError) as e:  # e.g. older snapshot format: refit and rewrite
+                print(f"⚠️  Snapshot not loaded ({e}), fitting instead")
+        db = ReadSessionLocal()
+        try:
+            if not sync_recommendation_engine(db):
+                return
+        finally:
+            db.close()
+        _write_snapshot_if_behind()
+
+def build_cf_model():
+    """Background job: build the co-occurrence model from the full behavior history"""
+    cf_model.begin_build()  # Live events during the scan are replayed afterwards
+    db = ReadSessionLocal()
+    try:
+        behavior_buffer.flush()
+        cf_model.build(iter_item_interactions(db))
+    except Exception as e:
+        print(f"❌ Co-occurrence build failed: {e}")
+    finally:
+        cf_model.end_build()
+        db.close()
+
+def build_graph_model():
+    """
+    Background job: build the user-product graph from the full behavior
+    history, unless no behavior was stored since the last build
+    """
+    global _graph_high_water
+    db = ReadSessionLocal()
+    try:
+        behavior_buffer.flush()
+        high_water = get_max_behavior_id(db)  # Read first: later rows trigger the next build
+        if graph_model.is_built and high_water == _graph_high_water:
+            return
+        graph_model.build(iter_item_interactions(db))
+        _graph_high_water = high_water
+    except Exception as e:
+        print(f"❌ Graph build failed: {e}")
+    finally:
+        db.close()
+
+def _graph_rebuilder():
+    while True:
+        time.sleep(GRAPH_REBUILD_INTERVAL)
+        build_graph_model()
+
+def build_session_model():
+    """Background job: sessionize the full behavior history into next-item transitions"""
+    session_model.begin_build()  # Live events during the scan are replayed afterwards
+    db = ReadSessionLocal()
+    try:
+        behavior_buffer.flush()
+        session_model.build(iter_training_behaviors(db))
+    except Exception as e:
+        print(f"❌ Session model build failed: {e}")
+    finally:
+        session_model.end_build()
+        db.close()
+
+def build_collaborative_models():
+    build_cf_model()
+    build_graph_model()
+    build_session_model()
+
+def warm_start_cf_model():
+    threading.Thread(target=build_collaborative_models, name="cf-build", daemon=True).start()
+    threading.Thread(target=_graph_rebuilder, name="graph-rebuild", daemon=True).start()
+
+def collaborative_scores(user_id):
+    """
+    Candidate scores blended with the content scores: co-occurrence, or a
+    personalized PageRank walk when the user's history is too sparse for it
+    """
+    if not cf_model.is_built:
+        return None
+    items = cf_model.user_items(user_id)
+    if graph_model.is_built and len(items) < GRAPH_SPARSE_HISTORY:
+        return graph_model.score_user(user_id, items)
+    return cf_model.score_user(user_id)
+
+def record_behavior_event(behavior, productcontext=None):
+    """
+    Apply a just-stored UserBehavior to the user's cached interest profile
+    (one sparse add - no history reload), the co-occurrence model and the
+    session transitions
+    """
+    recommendation_engine.record_behavior(behavior.userid, {
+        'action': behavior.action,
+        'searchquery': behavior.searchquery,
+        'productid': behavior.productid,
+        'productcontext': productcontext
+    })
+    cf_model.add_interaction(behavior.userid, behavior.productid, behavior.action)
+    session_model.add_event(behavior.userid, behavior.productid, behavior.action)
+
 @router.get("/", response_model=List[Recommendation])
 async def get_user_recommendations(
+    response: Response,
     user_id: str = "demo_user_1",
     top_n: int = 5,
-    db: Session = Depends(get_db)
+    cf_weight: Optional[float] = Query(None, ge=0.0, le=1.0),
+    db: AsyncSession = Depends(get_async_db),
+    queries = Depends(recommend_query_budget)
 ):
     """
     🔥 MAIN RECOMMENDATIONS ENDPOINT
     Returns personalized recommendations based on user behavior history
     """
     
-    # Step 1: Get user behaviors from database
-    behaviors = get_user_behaviors(db, user_id)
-    if not behaviors:
-        raise HTTPException(status_code=404, detail="No behavior history. Browse/search first!")
-    
-    # Step 2: Get active products
-    active_products = get_products(db)
-    if not active_products:
-        raise HTTPException(status_code=404, detail="No active products available!")
-    
-    product_contexts = [p.productcontext for p in active_products]
+    # Step 1: Pick up catalog changes made by any worker (shared version in
+    # the DB) in the background sync; until it publishes, score the current
+    # index (Step 4 drops products deactivated since). Only an engine that
+    # was never fitted waits for it.
+    version = await catalog_tracker.refresh_async(db)
+    if not recommendation_engine_is_current(version):
+        sync = schedule_engine_sync()
+        if not recommendation_engine.is_fitted and not await asyncio.wrap_future(sync):
+            raise HTTPException(status_code=404, detail="No active products available!")
     
-    # Step 3: Fit ML engine if needed
-    if not recommendation_engine.is_fitted:
-        recommendation_engine.fit(product_contexts)
+    # From here on the request runs against one deadline: the cold profile
+    # build, collaborative candidates and scoring all draw from it
+    deadline = RequestDeadline(scoring_executor.deadline)
     
-    # Step 4: Convert DB behaviors to ML format
-    user_behaviors = []
-    for behavior in behaviors:
-        if behavior.action == 'search':
-            user_behaviors.append({
-                'action': 'search',
-                'searchquery': behavior.searchquery
-            })
-        else:  # view or click
-            product = db.query(Product).filter(Product.id == behavior.productid).first()
-            if product:
-                user_behaviors.append({
-                    'action': behavior.action,
-                    'productcontext': product.productcontext
-                })
+    # Step 2: Cached interest profile, rebuilt from DB history on a miss or when
+    # the DB holds behaviors it has not seen (stored by another worker), all
+    # against one captured index even if a sync publishes a new one meanwhile
+    index = recommendation_engine.index
+    stored = await count_user_behaviors_async(db, user_id)
+    user_vector = recommendation_engine.cached_profile(user_id, index=index, high_water=stored)
+    if user_vector is None:
+        try:
+            # Cold rebuild must see still-buffered events
+            await scoring_executor.run_local(behavior_buffer.flush, deadline=deadline.remaining())
+            pairs = await get_user_behaviors_with_context_async(db, user_id)  # One joined query
+            behaviors = [b for b in (to_ml_behavior(*pair) for pair in pairs) if b is not None]
+            user_vector = await scoring_executor.run_local(
+                partial(recommendation_engine.build_user_profile, index=index, high_water=len(pairs)),
+                user_id, behaviors, deadline=deadline.remaining()
+            )
+        except ScoringTimeout:
+            return await degraded_recommendations(db, top_n, response)
+        cf_model.set_user_items(user_id, behaviors)  # Same staleness: reseed from the DB too
+    if user_vector is None:
+        raise HTTPException(status_code=404, detail="No behavior history. Browse/search first!")
     
-    # Step 5: Generate recommendations!
-    recs = recommendation_engine.get_recommendations(user_behaviors, product_contexts, top_n)
+    # Step 3: Score (content blended with collaborative candidates) + explain in
+    # the scoring executor; collaborative candidates that miss the deadline
+    # are skipped (content-only scores)
+    cf_weight = CF_WEIGHT if cf_weight is None else cf_weight
+    cf_scores = None
+    if cf_weight > 0:
+        try:
+            cf_scores = await scoring_executor.run_local(collaborative_scores, user_id,
+                                                         deadline=deadline.remaining())
+        except ScoringTimeout:
+            pass
+    run, task = scoring_task(index, user_vector, top_n, cf_scores, cf_weight)
+    try:
+        recs = await run(*task, deadline=deadline.remaining())
+    except ScoringTimeout:
+        return await degraded_recommendations(db, top_n, response)
     
-    # Step 6: Format response with product details
+    # Step 4: Format response with product details (a product deactivated
+    # after the version read above is still dropped here)
+    products_by_id = {
+        p.id: p for p in await get_products_by_ids_async(db, [r['product_id'] for r in recs])
+    }
     recommendations = []
     for rec in recs:
-        product = active_products[rec['product_index']]
+        product = products_by_id.get(rec['product_id'])
+        if product is None or not product.isactive or product.stock <= 0:
+            continue
         recommendations.append({
             'product_id': product.id,
             'name': product.name,
             'price': float(product.price),
             'similarity_score': rec['similarity_score'],
             'match_percentage': rec['match_percentage'],
-            'explanation': recommendation_engine.explain_recommendation(
-                user_behaviors, product.productcontext
-            )
+            'explanation': rec['explanation']
         })
     
     return recommendations[:top_n]
 
+@router.get("/next-up", response_model=List[NextUpItem])
+async def get_next_up(
+    user_id: str = "demo_user_1",
+    items: Optional[List[int]] = Query(None),
+    top_n: int = Query(5, ge=1, le=50)
+):
+    """
+    ⏭️ NEXT UP
+    Likely next products from the user's open session (or explicit recent
+    items, oldest first) - in-memory transitions only, no DB access. The
+    session is the one this worker ingested (record_behavior_event).
+    """
+    recent = items if items else session_model.session_items(user_id)
+    return [
+        {'product_id': product_id, 'score': score}
+        for product_id, score in session_model.next_up(recent, top_n)
+    ]
+
+@router.post("/batch", response_model=List[UserRecommendations])
+def get_batch_recommendations(
+    request: BatchRecommendationRequest,
+    db: Session = Depends(get_read_db)
+):
+    """
+    📬 BATCH RECOMMENDATIONS (nightly email job)
+    Scores many users with one sparse matrix multiply per memory-bounded chunk
+    (plain def: the heavy sync work runs in the threadpool, not on the event loop)
+    """
+    catalog_tracker.refresh(db)
+    if not recommendation_engine_is_current() and not sync_recommendation_engine_locked():
+        raise HTTPException(status_code=404, detail="No active products available!")
+    
+    # Users are keyed the way the INTEGER userid column stores them ('007' -> '7')
+    behavior_buffer.flush()
+    user_ids = list(dict.fromkeys(request.user_ids))
+    keys = list(dict.fromkeys(user_id_key(user_id) for user_id in user_ids))
+    
+    # Load behaviors + product contexts one scoring chunk at a time (joined,
+    # IN-batched queries), so memory stays within the engine's batch budget
+    index = recommendation_engine.index
+    chunk_size = recommendation_engine.batch_chunk_size(index=index)
+    recs_by_user = {}
+    for start in range(0, len(keys), chunk_size):
+        behaviors_by_user = {key: [] for key in keys[start:start + chunk_size]}
+        for behavior, productcontext in get_behaviors_with_context_for_users(db, list(behaviors_by_user)):
+            ml_behavior = to_ml_behavior(behavior, productcontext)
+            behaviors = behaviors_by_user.get(user_id_key(behavior.userid))
+            if ml_behavior is not None and behaviors is not None:
+                behaviors.append(ml_behavior)
+        recs_by_user.update(recommendation_engine.get_recommendations_batch(
+            behaviors_by_user, top_n=request.top_n, index=index
+        ))
+    
+    # Format with product details (one lookup for all recommended products)
+    recommended_ids = {r['product_id'] for recs in recs_by_user.values() for r in recs}
+    products_by_id = {p.id: p for p in get_products_by_ids(db, recommended_ids)}
+    return [
+        {
+            'user_id': user_id,
+            'recommendations': [
+                {
+                    'product_id': rec['product_id'],
+                    'name': products_by_id[rec['product_id']].name,
+                    'price': float(products_by_id[rec['product_id']].price),
+                    'similarity_score': rec['similarity_score'],
+                    'match_percentage': rec['match_percentage']
+                }
+                for rec in recs_by_user[user_id_key(user_id)]
+                if rec['product_id'] in products_by_id
+            ]
+        }
+        for user_id in user_ids
+    ]
+
 @router.get("/debug/{user_id}")
-async def debug_recommendations(user_id: str, db: Session = Depends(get_db)):
-    """Debug endpoint - shows raw data"""
-    behaviors = get_user_behaviors(db, user_id)
-    products = get_products(db)
+async def debug_recommendations(user_id: str, after: int = 0, db: AsyncSession = Depends(get_async_db)):
+    """Debug endpoint - shows raw data (one keyset page of the catalog)"""
+    behaviors = [b for b, _ in await get_user_behaviors_with_context_async(db, user_id)]
+    products, next_after = await get_products_page_async(db, after_id=after)
     
     return {
         "user_id": user_id,
         "behavior_count": len(behaviors),
         "product_count": len(products),
+        "next_after": next_after,
         "behaviors": [
             {
                 "action": b.action,
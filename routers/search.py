@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from crud import get_active_product_ids_async, get_products_by_ids_async
+from catalog import catalog_tracker
+from routers.recommend import (recommendation_engine, recommendation_engine_is_current,
+                               sync_recommendation_engine_locked)
+from schemas import SearchResult
+from typing import List, Optional
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("/", response_model=List[SearchResult])
+async def semantic_search(
+    q: str = Query(..., min_length=1),
+    top_n: int = Query(10, ge=1, le=100),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    🔎 SEMANTIC SEARCH
+    Scores the query's TF-IDF vector against the recommender's cached product
+    matrix (same vocabulary + top-k path as recommendations)
+    """
+    version = await catalog_tracker.refresh_async(db)
+    if not recommendation_engine_is_current(version) and not await run_in_threadpool(
+        sync_recommendation_engine_locked
+    ):
+        raise HTTPException(status_code=404, detail="No active products available!")
+
+    filters = {}
+    if min_price is not None or max_price is not None:
+        filters['product_ids'] = await get_active_product_ids_async(db, min_price, max_price)
+    hits = await run_in_threadpool(recommendation_engine.search, q, top_n, filters)
+
+    products_by_id = {
+        p.id: p for p in await get_products_by_ids_async(db, [h['product_id'] for h in hits])
+    }
+    return [
+        {
+            'product_id': hit['product_id'],
+            'name': products_by_id[hit['product_id']].name,
+            'price': float(products_by_id[hit['product_id']].price),
+            'similarity_score': hit['similarity_score'],
+            'match_percentage': hit['match_percentage']
+        }
+        for hit in hits
+        if hit['product_id'] in products_by_id
+    ]
@@ -0,0 +1,131 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, ReadSessionLocal
+from crud import get_products_by_ids_async
+from catalog import catalog_tracker
+from ml.neighbors import NEIGHBORS_FORMAT, NeighborTable
+from ml.snapshots import read_manifest, single_writer
+from routers.recommend import recommendation_engine, sync_recommendation_engine_locked
+from schemas import SimilarProduct
+from typing import List
+import os
+import threading
+
+router = APIRouter(prefix="/products", tags=["recommendations"])
+
+# Precomputed item-to-item neighbors, swapped in whole by the background job
+# (catalog changes recompute only the rows they reach; see NeighborTable.updated)
+NEIGHBORS_PATH = os.environ.get("RECOMMENDER_NEIGHBORS", "snapshots/neighbors")
+neighbor_table = None
+_build_thread = None
+_schedule_lock = threading.Lock()
+
+def _saved_table_version():
+    """Catalog version of the table on disk (None if there is no loadable one)"""
+    manifest = read_manifest(NEIGHBORS_PATH)
+    if manifest is None or manifest.get('format') != NEIGHBORS_FORMAT:
+        return None
+    return manifest['catalog_version']
+
+def _next_table(saved_version, index):
+    """
+    The table for `index`: the saved one updated with the products changed
+    since, or a full build (none saved, another fit, or the change log no
+    longer reaches back)
+    """
+    if saved_version is not None:
+        saved = NeighborTable.load(NEIGHBORS_PATH)
+        if saved.fit_id is not None and saved.fit_id == index.fit_id:
+            db = ReadSessionLocal()
+            try:
+                changed_ids = catalog_tracker.changes_since(db, saved_version, index.catalog_version)
+            finally:
+                db.close()
+            if changed_ids is not None:
+                return saved.updated(index.product_matrix, index.product_ids, index.product_active,
+                                     changed_ids, index.catalog_version)
+    return NeighborTable.build(index.product_matrix, index.product_ids, index.product_active,
+                               catalog_version=index.catalog_version, fit_id=index.fit_id)
+
+def build_neighbor_table():
+    """
+    Background job: bring the table up to the engine's catalog version
+    
+    One worker at a time holds the table's writer lock; if another already
+    saved a table at least this new, it is mapped instead of recomputed.
+    """
+    global neighbor_table
+    try:
+        if not sync_recommendation_engine_locked():
+            return
+        index = recommendation_engine.index  # Published whole: one consistent catalog
+        with single_writer(NEIGHBORS_PATH):
+            saved_version = _saved_table_version()
+            if saved_version is not None and saved_version >= index.catalog_version:
+                neighbor_table = NeighborTable.load(NEIGHBORS_PATH)
+                return
+            table = _next_table(saved_version, index)
+            table.save(NEIGHBORS_PATH)
+        neighbor_table = NeighborTable.load(NEIGHBORS_PATH)  # Serve the mmap'd copy
+    except Exception as e:
+        print(f"❌ Neighbor table build failed: {e}")
+
+def schedule_neighbor_build():
+    """Start the background build unless one is already running"""
+    global _build_thread
+    with _schedule_lock:
+        if _build_thread is not None and _build_thread.is_alive():
+            return
+        _build_thread = threading.Thread(target=build_neighbor_table, name="neighbor-table", daemon=True)
+        _build_thread.start()
+
+def neighbor_table_is_current():
+    """Table covers the engine's catalog version (one mapped from another worker may be newer)"""
+    return (neighbor_table is not None
+            and neighbor_table.catalog_version >= recommendation_engine.catalog_version)
+
+def warm_start_neighbor_table():
+    """Worker boot: map the last saved table, then refresh it in the background"""
+    global neighbor_table
+    if neighbor_table is None and _saved_table_version() is not None:
+        neighbor_table = NeighborTable.load(NEIGHBORS_PATH)
+    schedule_neighbor_build()
+
+async def similar_products(db: AsyncSession, product_id: int, k: int = 10):
+    """
+    Neighbors of a product from the table, as active products (one id lookup
+    query); the whole row is read so inactive neighbors can be masked out
+    """
+    if not neighbor_table_is_current():
+        schedule_neighbor_build()  # Serve the previous table meanwhile
+    if neighbor_table is None:
+        return []
+    neighbors = neighbor_table.similar(product_id, None)
+    products_by_id = {
+        p.id: p for p in await get_products_by_ids_async(db, [pid for pid, _ in neighbors])
+    }
+    return [
+        {
+            'product_id': pid,
+            'name': products_by_id[pid].name,
+            'price': float(products_by_id[pid].price),
+            'similarity_score': score
+        }
+        for pid, score in neighbors
+        if pid in products_by_id and products_by_id[pid].isactive and products_by_id[pid].stock > 0
+    ][:k]
+
+@router.get("/{product_id}/similar", response_model=List[SimilarProduct])
+async def get_similar_products(
+    product_id: int,
+    k: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    🧩 SIMILAR PRODUCTS
+    Row lookup in the precomputed neighbor table - no scoring per request
+    """
+    if neighbor_table is None:
+        schedule_neighbor_build()
+        raise HTTPException(status_code=503, detail="Similar products are still being computed")
+    return await similar_products(db, product_id, k)
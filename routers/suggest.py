@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from database import ReadSessionLocal
+from crud import (get_products_by_ids, iter_active_product_names, get_product_interaction_counts,
+                  get_popular_search_queries)
+from catalog import catalog_tracker
+from ml.suggest import SuggestIndex
+from schemas import Suggestion
+from typing import List
+import threading
+
+router = APIRouter(prefix="/suggest", tags=["search"])
+
+# Global suggestion index (singleton, like the recommendation engine)
+suggest_index = SuggestIndex()
+_suggest_lock = threading.Lock()
+
+def rebuild_suggest_index(db: Session, version):
+    """Full build from the active catalog + past searches"""
+    popularity = get_product_interaction_counts(db)
+    suggest_index.build(
+        ((pid, name, popularity.get(pid, 0)) for pid, name in iter_active_product_names(db)),
+        get_popular_search_queries(db),
+        version
+    )
+
+def sync_suggest_index(db: Session):
+    """
+    Bring the index up to the catalog version
+    - First call (or change log overrun): full build
+    - Otherwise: re-index only the products touched since the last sync
+    """
+    version = catalog_tracker.refresh(db)
+    if suggest_index.catalog_version == version:
+        return
+    changed_ids = catalog_tracker.changes_since(db, suggest_index.catalog_version, version)
+    if changed_ids is None:
+        rebuild_suggest_index(db, version)
+        return
+    live = set()
+    for product in get_products_by_ids(db, changed_ids):
+        if product.isactive and product.stock > 0:
+            suggest_index.add_product(product.id, product.name)
+            live.add(product.id)
+    for product_id in changed_ids - live:
+        suggest_index.remove_product(product_id)
+    suggest_index.set_catalog_version(version)
+
+def sync_suggest_index_locked():
+    """sync_suggest_index() on its own read Session, serialized - for the threadpool"""
+    with _suggest_lock:
+        db = ReadSessionLocal()
+        try:
+            sync_suggest_index(db)
+        finally:
+            db.close()
+
+def record_search_query(query):
+    """Count a just-made search toward the popular-query suggestions"""
+    suggest_index.add_query(query)
+
+@router.get("/", response_model=List[Suggestion])
+async def suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(8, ge=1, le=20)
+):
+    """
+    ⌨️ TYPEAHEAD SUGGESTIONS
+    In-memory prefix lookup - the only DB access is the shared catalog
+    version, re-read at most every poll interval (plus a sync when it moved)
+    """
+    if suggest_index.catalog_version != await catalog_tracker.poll_async():
+        await run_in_threadpool(sync_suggest_index_locked)
+    return suggest_index.suggest(q, limit)
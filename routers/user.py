@@ -1,21 +1,26 @@
 from fastapi import APIRouter, Depends, Request, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
-from sqlalchemy.orm import Session
-from database import get_db
-from crud import get_products, get_product, create_user_behavior, get_user_behaviors
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from crud import get_products_page_async, get_product_async, search_products_async
+from ingest import behavior_buffer
 from schemas import UserBehaviorCreate
 from models import Product
+from routers.recommend import record_behavior_event
+from routers.suggest import record_search_query
+from routers.similar import similar_products
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
 @router.get("/", response_class=HTMLResponse)
-async def store_home(request: Request, db: Session = Depends(get_db)):
-    products = get_products(db)
+async def store_home(request: Request, after: int = 0, db: AsyncSession = Depends(get_async_db)):
+    products, next_after = await get_products_page_async(db, after_id=after)  # Keyset page, not the whole catalog
     return templates.TemplateResponse("user/index.html", {
         "request": request, 
-        "products": products
+        "products": products,
+        "next_after": next_after
     })
 
 @router.get("/product/{product_id}", response_class=HTMLResponse)
@@ -23,22 +28,25 @@ async def product_detail(
     request: Request,
     product_id: int,
     user_id: str = "demo_user_1",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     behavior = UserBehaviorCreate(
         userid=user_id,
         productid=product_id,
         action="view"
     )
-    create_user_behavior(db, behavior)
+    stored = behavior_buffer.enqueue(behavior)  # Written behind by the flusher thread
     
-    product = get_product(db, product_id)
+    product = await get_product_async(db, product_id)
+    if stored:  # A dropped event would put cached profiles ahead of the DB
+        record_behavior_event(behavior, product.productcontext if product else None)
     if not product:
         return HTMLResponse("Product not found", status_code=404)
     
     return templates.TemplateResponse("user/product_detail.html", {
         "request": request,
         "product": product,
+        "similar": await similar_products(db, product_id, k=4),  # Precomputed neighbors
         "user_id": user_id
     })
 
@@ -46,41 +54,50 @@ async def product_detail(
 async def search_products(
     request: Request,
     q: str = Query(""),
+    page: int = Query(1, ge=1),
     user_id: str = "demo_user_1",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    if q.strip():
+    if q.strip() and page == 1:  # Paging through results is not a new search
         behavior = UserBehaviorCreate(
             userid=user_id,
             productid=None,
             action="search",
             searchquery=q.strip()
         )
-        create_user_behavior(db, behavior)
+        if behavior_buffer.enqueue(behavior):
+            record_behavior_event(behavior)
+        record_search_query(behavior.searchquery)
     
-    products = get_products(db)
     if q.strip():
-        products = [p for p in products if 
-                   q.lower() in p.name.lower() or 
-                   q.lower() in getattr(p, 'description', '').lower()]
+        # Ranked FTS5 match (prefixes) - no catalog scan
+        products, next_page = await search_products_async(db, q, page=page)
+    else:
+        products, _ = await get_products_page_async(db)  # First catalog page
+        next_page = None
     
     return templates.TemplateResponse("user/search.html", {
         "request": request,
         "products": products,
-        "query": q
+        "query": q,
+        "page": page,
+        "next_page": next_page,
+        "user_id": user_id
     })
 
 # 🔥 THIS WAS MISSING - ALL PRODUCTS!
 @router.get("/products", response_class=HTMLResponse)
 async def all_products(
     request: Request,
-    db: Session = Depends(get_db)
+    after: int = 0,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """ALL PRODUCTS - Shows your admin products!"""
-    products = get_products(db)  # Same as home/search
+    products, next_after = await get_products_page_async(db, after_id=after)  # Same as home
     
     return templates.TemplateResponse("user/products.html", {
         "request": request,
         "products": products,
+        "next_after": next_after,
         "title": "All Products"
     })
@@ -34,3 +34,40 @@ class Recommendation(BaseModel):
     price: float
     similarity_score: float
     match_percentage: float
+    explanation: Optional[str] = None
+
+class SearchResult(BaseModel):
+    product_id: int
+    name: str
+    price: float
+    similarity_score: float
+    match_percentage: float
+
+class SimilarProduct(BaseModel):
+    product_id: int
+    name: str
+    price: float
+    similarity_score: float
+
+class FactorizedRecommendation(BaseModel):
+    product_id: int
+    name: str
+    price: float
+    score: float
+
+class NextUpItem(BaseModel):
+    product_id: int
+    score: float
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # 'product' or 'query'
+    product_id: Optional[int] = None
+
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[str]
+    top_n: int = 5
+
+class UserRecommendations(BaseModel):
+    user_id: str
+    recommendations: List[Recommendation]
@@ -0,0 +1,215 @@
+"""
+Recommendation Scoring Executor
+- CPU-bound scoring (cosine mat-vec, top-k, explanations) runs off the
+  event loop in a thread pool (NumPy/SciPy release the GIL) or in a
+  process pool whose workers map the shared snapshot matrix
+- Tracks queue depth, queue wait and run time per task
+- run() enforces a per-request deadline: the caller gets ScoringTimeout and
+  serves a degraded result instead of waiting on a slow scoring call
+- run_local() applies the same deadline to in-process work (profile
+  builds, collaborative candidates) on a thread pool, in either mode
+- Thread tasks run in a copy of the caller's context (contextvars), so
+  per-request state such as the active QueryCounter follows them
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+class ScoringTimeout(Exception):
+    pass
+
+class RequestDeadline:
+    """One request's time budget, shared by the steps it runs through the executor"""
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+# Per-process engine for process-pool workers (loaded from the snapshot)
+_worker_engine = None
+_worker_snapshot_token = None
+
+def snapshot_token(snapshot_path):
+    """Changes whenever a new snapshot is swapped in at `snapshot_path`"""
+    return os.stat(os.path.join(snapshot_path, 'manifest.json')).st_mtime_ns
+
+def score_from_snapshot(snapshot_path, token, user_vector, top_n=5, top_words=5,
+                        cf_scores=None, cf_weight=0.0):
+    """Process-pool task: score + explain with the worker's mmap'd snapshot engine"""
+    global _worker_engine, _worker_snapshot_token
+    if _worker_engine is None or _worker_snapshot_token != token:
+        from ml.recommender import RecommenderEngine
+        engine = RecommenderEngine()
+        engine.load(snapshot_path)  # Zero-copy: every worker shares the page cache
+        _worker_engine, _worker_snapshot_token = engine, token
+    return score_and_explain(_worker_engine, user_vector, top_n, top_words, cf_scores, cf_weight)
+
+def score_and_explain(engine, user_vector, top_n=5, top_words=5, cf_scores=None, cf_weight=0.0,
+                      index=None):
+    """
+    Top-N recommendations for a profile, each with its explanation string
+    (blended with collaborative scores when cf_scores are given), all from
+    one CatalogIndex (`index`, default: the engine's published one)
+    """
+    index = engine.index if index is None else index
+    recs = engine.recommend_blended(user_vector, cf_scores, top_n=top_n, cf_weight=cf_weight, index=index)
+    explanations = engine.explain_recommendations(
+        user_vector, [r['product_id'] for r in recs], top_words, index=index
+    )
+    for rec, explanation in zip(recs, explanations):
+        if explanation == "Matches on: " and cf_scores and rec['product_id'] in cf_scores:
+            explanation = "Often viewed together with items you viewed"
+        rec['explanation'] = explanation
+    return recs
+
+class ScoringExecutor:
+    def __init__(self, kind="thread", max_workers=None, deadline=1.0):
+        """
+        Args:
+            kind: 'thread' (scores the in-process engine) or 'process'
+                (workers score a memory-mapped snapshot of it)
+            max_workers: Pool size (defaults to the CPU count)
+            deadline: Default seconds a request waits for its result
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError("kind must be 'thread' or 'process'")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.deadline = deadline
+        self._pool = None
+        self._local_pool = None  # Threads for run_local() when the main pool is processes
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "queued": 0,
+            "running": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "deadline_exceeded": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+            "run_ms_total": 0.0,
+            "run_ms_max": 0.0
+        }
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="scoring")
+            return self._pool
+
+    def _get_local_pool(self):
+        if self.kind != "process":
+            return self._get_pool()
+        with self._pool_lock:
+            if self._local_pool is None:
+                self._local_pool = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                      thread_name_prefix="scoring-local")
+            return self._local_pool
+
+    def _timed(self, fn, submitted, *args):
+        """Runs in a pool thread: record queue wait, then run time"""
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.stats["queued"] -= 1
+            self.stats["running"] += 1
+            wait_ms = (started - submitted) * 1000
+            self.stats["wait_ms_total"] += wait_ms
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], wait_ms)
+        ok = False
+        try:
+            result = fn(*args)
+            ok = True
+            return result
+        finally:
+            run_ms = (time.perf_counter() - started) * 1000
+            with self._stats_lock:
+                self.stats["running"] -= 1
+                self.stats["completed" if ok else "failed"] += 1
+                self.stats["run_ms_total"] += run_ms
+                self.stats["run_ms_max"] = max(self.stats["run_ms_max"], run_ms)
+
+    def _done(self, timed, future):
+        """
+        Bookkeeping for tasks _timed() never saw: cancelled while queued, and
+        every process-pool task (wait and run time are not separable there)
+        """
+        if future.cancelled():
+            with self._stats_lock:
+                self.stats["queued"] -= 1
+                self.stats["cancelled"] += 1
+        elif not timed:
+            with self._stats_lock:
+                self.stats["queued"] -= 1
+                self.stats["failed" if future.exception() is not None else "completed"] += 1
+
+    async def run(self, fn, *args, deadline=None):
+        """
+        Run fn(*args) in the pool and await it for at most `deadline` seconds
+
+        In process mode fn and args must be picklable (module-level function).
+
+        Raises:
+            ScoringTimeout: The deadline passed (the task is left to finish
+                in the background; its result is discarded)
+        """
+        return await self._submit(self._get_pool(), self.kind != "process", fn, args, deadline)
+
+    async def run_local(self, fn, *args, deadline=None):
+        """run() on a thread of this process, even in process mode (for work on in-memory state)"""
+        return await self._submit(self._get_local_pool(), True, fn, args, deadline)
+
+    async def _submit(self, pool, timed, fn, args, deadline):
+        with self._stats_lock:
+            self.stats["submitted"] += 1
+            self.stats["queued"] += 1
+        if timed:
+            context = contextvars.copy_context()  # Pool threads do not inherit it
+            future = pool.submit(context.run, self._timed, fn, time.perf_counter(), *args)
+        else:
+            future = pool.submit(fn, *args)
+        future.add_done_callback(partial(self._done, timed))
+        deadline = self.deadline if deadline is None else max(deadline, 0.0)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), deadline)
+        except asyncio.TimeoutError:
+            future.cancel()  # Drops it if still queued; a running task finishes unobserved
+            with self._stats_lock:
+                self.stats["deadline_exceeded"] += 1
+            raise ScoringTimeout(f"Scoring exceeded its {deadline:.3f}s deadline")
+
+    def shutdown(self):
+        with self._pool_lock:
+            for pool in (self._pool, self._local_pool):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._local_pool = None
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        finished = max(stats["completed"] + stats["failed"], 1)
+        for key in ("wait_ms", "run_ms"):
+            stats[f"{key}_avg"] = round(stats.pop(f"{key}_total") / finished, 2)
+            stats[f"{key}_max"] = round(stats[f"{key}_max"], 2)
+        return dict(stats, kind=self.kind, max_workers=self.max_workers,
+                    deadline_s=self.deadline)
+
+# Process-wide executor used by the recommend endpoint
+scoring_executor = ScoringExecutor(
+    kind=os.environ.get("SCORING_EXECUTOR", "thread"),
+    max_workers=int(os.environ.get("SCORING_WORKERS", 0)) or None,
+    deadline=float(os.environ.get("SCORING_DEADLINE", 1.0))
+)